@@ -1,11 +1,46 @@
 # database.py
+import sqlite3
+import threading
+from pathlib import Path
 from sqlite_utils import Database
 
+DB_FILE = "trust_network.db"
+
+# Read-side tuning for API connections (per connection, not persisted)
+READ_PRAGMAS = (
+    "PRAGMA query_only = ON",
+    "PRAGMA mmap_size = 268435456",  # 256 MB of the file mapped, reads skip the page cache copy
+    "PRAGMA cache_size = -65536",    # 64 MB page cache
+    "PRAGMA temp_store = MEMORY",
+)
+
+_local = threading.local()
+
 def get_db():
-    return Database("trust_network.db")
+    return Database(DB_FILE)
+
+def get_read_conn():
+    """Read-only connection for the API, opened once per worker thread and reused.
+
+    Opened via a `mode=ro` URI so it can never take the write lock; with the DB in WAL
+    mode the indexer keeps writing while these read the last committed snapshot.
+    sqlite3's statement cache keeps the (constant) query strings prepared.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        uri = Path(DB_FILE).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in READ_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+    return conn
 
 def init_db():
     db = get_db()
+
+    # WAL is persistent: readers no longer block on (or block) the indexer's writes
+    db.enable_wal()
     
     # 1. The Trust Graph
     if "edges" not in db.table_names():
@@ -18,6 +53,50 @@ def init_db():
         }, pk=("source", "target", "token_id"))
         db["edges"].create_index(["source", "target"])
 
+    # 1b. Aggregated Trust Graph: one row per (source, target) pair, kept in step with
+    # `edges` by triggers so the indexer maintains it on every insert.
+    # Clustered on (source, target) -> forward lookups are covering; the reverse index
+    # covers "who supports X" (`target = ?`) without touching the table.
+    if "edge_counts" not in db.table_names():
+        db.executescript("""
+            CREATE TABLE edge_counts (
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                first_ts TEXT,
+                last_ts TEXT,
+                PRIMARY KEY (source, target)
+            ) WITHOUT ROWID;
+            CREATE INDEX idx_edge_counts_reverse ON edge_counts (target, source, count);
+            INSERT INTO edge_counts (source, target, count, first_ts, last_ts)
+                SELECT source, target, COUNT(*), MIN(timestamp), MAX(timestamp)
+                FROM edges GROUP BY source, target;
+        """)
+    db.executescript("""
+        CREATE TRIGGER IF NOT EXISTS edges_count_insert AFTER INSERT ON edges BEGIN
+            INSERT INTO edge_counts (source, target, count, first_ts, last_ts)
+            VALUES (NEW.source, NEW.target, 1, NEW.timestamp, NEW.timestamp)
+            ON CONFLICT (source, target) DO UPDATE SET
+                count = count + 1,
+                first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+                last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+        END;
+        CREATE TRIGGER IF NOT EXISTS edges_count_delete AFTER DELETE ON edges BEGIN
+            UPDATE edge_counts SET count = count - 1
+            WHERE source = OLD.source AND target = OLD.target;
+            DELETE FROM edge_counts
+            WHERE source = OLD.source AND target = OLD.target AND count <= 0;
+        END;
+    """)
+
+    # 1c. Canonical creator per token (persistent cache of TzKT firstMinter lookups)
+    if "creators" not in db.table_names():
+        db["creators"].create({
+            "contract": str,
+            "token_id": str,
+            "creator": str,
+        }, pk=("contract", "token_id"))
+
     # 2. Global Trust Scores (NEW)
     if "scores" not in db.table_names():
         db["scores"].create({
@@ -1,9 +1,11 @@
 # indexer.py
-import httpx
 import asyncio
 import json
+import logging
+import sqlite3
 from datetime import datetime
-from database import init_db, get_db
+from database import init_db, get_db, get_read_conn
+from tzkt_client import TzktClient
 
 # Contract Addresses
 HEN_V2 = "KT1HbQepzV1nVGg8QVznG7z4RcHseD5kwqBn"
@@ -12,10 +14,21 @@ TARGETS = [HEN_V2, TEIA_MARKET]
 
 # Settings
 BATCH_SIZE = 100       # How many collects to fetch per loop
-RATE_LIMIT_DELAY = 1.0 # Seconds to sleep between loops (Be nice to TzKT)
+PIPELINE_DEPTH = 4     # Pages buffered between pipeline stages
+TRACE_WORKERS = 2      # Pages traced concurrently (writes stay in order)
+TOKENS_PER_REQUEST = 100 # Tokens per batched /v1/tokens creator lookup
+WRITE_RETRIES = 6       # Attempts per page when the DB is busy (API / trust engine writing)
+TRACE_RETRY_DELAY = 5   # Seconds before a failed page is traced again
 
-# --- helpers: retries + canonical creator resolution ---
-_canonical_creator_cache = {}
+# --- helpers: canonical creator resolution ---
+_canonical_creator_cache = {}  # L1 in front of the persistent `creators` table
+
+# NULL rows (left by older runs) are looked up again
+CREATORS_IN_SQL = """
+    SELECT token_id, creator FROM creators
+    WHERE contract = ? AND token_id IN (SELECT value FROM json_each(?)) AND creator IS NOT NULL
+"""
+INSERT_CREATOR_SQL = "INSERT OR REPLACE INTO creators (contract, token_id, creator) VALUES (?, ?, ?)"
 
 def _normalize_addr_like(v):
     """Return a normalized address string from common TzKT shapes (str, dict with address/value)."""
@@ -29,63 +42,75 @@ def _normalize_addr_like(v):
         ).strip()
     return str(v).strip()
 
-async def get_with_retries(client, url, params=None, retries=3, backoff=1.0):
-    """Simple retry for transient 5xx / 429 responses."""
-    for attempt in range(1, retries + 1):
-        r = await client.get(url, params=params)
-        if r.status_code == 200:
-            return r
-        if r.status_code in (429, 502, 503, 504) and attempt < retries:
-            await asyncio.sleep(backoff * (2 ** (attempt - 1)))
-            continue
-        return r
+def _creator_from_token(token):
+    """Prefer authoritative on-chain minter/firstMinter from TzKT; fall back to token metadata."""
+    # firstMinter may be a string or an object; normalize safely
+    fm = _normalize_addr_like(token.get("firstMinter") or token.get("first_minter"))
+    if fm:
+        return fm
+
+    # metadata.creators entries are sometimes objects
+    md = token.get("metadata") or {}
+    creators = md.get("creators")
+    if isinstance(creators, list) and creators:
+        cand_addr = _normalize_addr_like(creators[0])
+        if cand_addr:
+            return cand_addr
+
+    return _normalize_addr_like(md.get("issuer")) or None
 
-async def fetch_canonical_creator(client, contract_addr, token_id):
-    """Prefer authoritative on-chain minter/firstMinter from TzKT; fall back to token metadata.
-    Results are cached in-memory for the run.
+async def resolve_creators(client, keys):
+    """Resolve canonical creators for many `(contract, token_id)` keys at once.
+
+    Lookup order: in-memory cache -> `creators` table -> TzKT, asking for up to
+    `TOKENS_PER_REQUEST` tokens per request (`tokenId.in`). Returns
+    `(resolved, fresh)` where `fresh` holds the rows fetched from TzKT that still
+    need persisting (the writer stores them with the page). A failed lookup raises,
+    so the page is traced again rather than written without its artists.
     """
-    key = (contract_addr, str(token_id))
-    if key in _canonical_creator_cache:
-        return _canonical_creator_cache[key]
+    resolved = {}
+    missing = set()
+    for key in keys:
+        if key in _canonical_creator_cache:
+            resolved[key] = _canonical_creator_cache[key]
+        else:
+            missing.add(key)
+    if not missing:
+        return resolved, {}
 
-    try:
-        r = await get_with_retries(client, "https://api.tzkt.io/v1/tokens", params={
-            "contract": contract_addr,
-            "tokenId": token_id,
-            "select": "metadata,firstMinter"
-        })
-        if r.status_code == 200:
-            items = r.json()
-            if items:
-                token = items[0]
-
-                # firstMinter may be a string or an object; normalize safely
-                fm_raw = token.get("firstMinter") or token.get("first_minter")
-                fm = _normalize_addr_like(fm_raw)
-                if fm:
-                    _canonical_creator_cache[key] = fm
-                    return fm
-
-                # metadata.creators entries are sometimes objects
-                md = token.get("metadata") or {}
-                creators = md.get("creators")
-                if isinstance(creators, list) and creators:
-                    candidate = creators[0]
-                    cand_addr = _normalize_addr_like(candidate)
-                    if cand_addr:
-                        _canonical_creator_cache[key] = cand_addr
-                        return cand_addr
-
-                issuer = md.get("issuer")
-                issuer_addr = _normalize_addr_like(issuer)
-                if issuer_addr:
-                    _canonical_creator_cache[key] = issuer_addr
-                    return issuer_addr
-    except Exception as e:
-        print(f"⚠️ canonical-creator lookup failed for {contract_addr}/{token_id}: {e}")
-
-    _canonical_creator_cache[key] = None
-    return None
+    # 2. Persistent cache (survives restarts)
+    by_contract = {}
+    for contract, token_id in missing:
+        by_contract.setdefault(contract, []).append(token_id)
+    conn = get_read_conn()
+    for contract, token_ids in by_contract.items():
+        for row in conn.execute(CREATORS_IN_SQL, (contract, json.dumps(token_ids))):
+            key = (contract, row["token_id"])
+            resolved[key] = _canonical_creator_cache[key] = row["creator"]
+            missing.discard(key)
+
+    # 3. TzKT, batched per contract
+    fresh = {}
+    by_contract = {}
+    for contract, token_id in missing:
+        by_contract.setdefault(contract, []).append(token_id)
+    for contract, token_ids in by_contract.items():
+        for i in range(0, len(token_ids), TOKENS_PER_REQUEST):
+            chunk = token_ids[i:i + TOKENS_PER_REQUEST]
+            tokens = await client.get_json("https://api.tzkt.io/v1/tokens", params={
+                "contract": contract,
+                "tokenId.in": ",".join(chunk),
+                "select": "tokenId,metadata,firstMinter",
+                "limit": len(chunk),
+            })
+            found = {str(t.get("tokenId")): _creator_from_token(t) for t in tokens}
+            for token_id in chunk:
+                key = (contract, token_id)
+                resolved[key] = creator = found.get(token_id)
+                # only cache real answers: a token TzKT doesn't return yet (fresh mint) is asked again later
+                if creator:
+                    fresh[key] = _canonical_creator_cache[key] = creator
+    return resolved, fresh
 
 async def get_starting_cursor(client):
     """
@@ -117,143 +142,230 @@ async def get_starting_cursor(client):
     print(f"🏁 Starting from Genesis ID: {start_id}")
     return start_id
 
-async def save_cursor(last_id):
-    """Save our progress to the DB."""
-    db = get_db()
-    db["state"].insert(
-        {"key": "last_processed_id", "value": last_id}, 
-        pk="key", 
-        replace=True
+INSERT_EDGE_SQL = """
+    INSERT OR IGNORE INTO edges (source, target, token_id, contract, timestamp)
+    VALUES (:source, :target, :token_id, :contract, :timestamp)
+"""  # OR IGNORE: re-seen collects must not bump edge_counts
+
+def save_cursor(conn, last_id):
+    """Save our progress. Runs inside the caller's transaction (no commit here)."""
+    conn.execute("""
+        INSERT INTO state (key, value) VALUES ('last_processed_id', ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+    """, (last_id,))
+
+async def fetch_collect_pages(client, cursor_id, out_q):
+    """Stage 1: page through collect operations and hand them downstream in order.
+
+    Only the in-memory read cursor advances here; the DB cursor is committed by the writer.
+    """
+    seq = 0
+    while True:
+        try:
+            r_collects = await client.get(
+                "https://api.tzkt.io/v1/operations/transactions",
+                params={
+                    "target.in": ",".join(TARGETS),
+                    "entrypoint": "collect",
+                    "status": "applied",
+                    "limit": BATCH_SIZE,
+                    "sort.asc": "id",
+                    "id.gt": cursor_id,
+                    "select": "hash,sender,timestamp,id" 
+                }
+            )
+        except Exception as e:
+            print(f"❌ Collect fetch failed: {e}. Sleeping...")
+            await asyncio.sleep(5)
+            continue
+
+        if r_collects.status_code != 200:
+            print(f"⚠️ API Error {r_collects.status_code}. Sleeping...")
+            await asyncio.sleep(5)
+            continue
+
+        collects = r_collects.json()
+        if not collects:
+            print("💤 caught up to tip. Sleeping 10s...")
+            await asyncio.sleep(10)
+            continue
+
+        # blocks while the pipeline is full (backpressure)
+        await out_q.put((seq, collects))
+        seq += 1
+        cursor_id = collects[-1]["id"]
+
+async def trace_collects(client, collects):
+    """Turn one page of collects into edge rows (trace groups -> transfers -> creators).
+    Returns `(edges, new_creators)`; the latter are persisted together with the page.
+    A failed request raises (after the client's own retries) so the page is traced again.
+    """
+    # --- STEP 2: Trace Execution (Get Internal Ops) ---
+    group_hashes = list(set([c["hash"] for c in collects]))
+    valid_op_ids = []
+    
+    # Fetch detailed traces for these groups
+    # Processing in mini-batches to prevent URL overflow
+    trace_chunk_size = 10
+    for i in range(0, len(group_hashes), trace_chunk_size):
+        chunk = group_hashes[i:i + trace_chunk_size]
+        trace_tasks = [client.get_json(f"https://api.tzkt.io/v1/operations/{h}") for h in chunk]
+        traces = await asyncio.gather(*trace_tasks)
+
+        for ops in traces:
+            valid_op_ids.extend([op["id"] for op in ops])
+    
+    # --- STEP 3: Fetch Resulting Transfers ---
+    edges = []
+    new_creators = {}
+    if not valid_op_ids:
+        return edges, new_creators
+
+    # Batch fetch transfers
+    transfers = await client.get_json(
+        "https://api.tzkt.io/v1/tokens/transfers",
+        params={
+            "transactionId.in": ",".join(map(str, valid_op_ids)),
+            "select": "to,token,transactionId,timestamp"
+        }
     )
 
+    # Resolve every artist on the page in one batched pass (prefer on-chain canonical minter)
+    def token_key(tx):
+        token = tx.get("token") or {}
+        token_contract = (token.get("contract") or {}).get("address")
+        token_id = token.get("tokenId") or token.get("token_id")
+        if token_contract and token_id is not None:
+            return (token_contract, str(token_id))
+        return None
+
+    keys = {k for k in map(token_key, transfers) if k}
+    resolved, new_creators = await resolve_creators(client, keys)
+
+    for tx in transfers:
+        try:
+            buyer = tx.get("to", {}).get("address")
+            token = tx.get("token", {})
+            metadata = token.get("metadata", {})
+
+            key = token_key(tx)
+            artist = resolved.get(key) if key else None
+
+            # fallback to embedded metadata (handle dict/list shapes safely)
+            if not artist:
+                md_creators = metadata.get("creators")
+                if isinstance(md_creators, list) and len(md_creators) > 0:
+                    artist = _normalize_addr_like(md_creators[0])
+                else:
+                    artist = _normalize_addr_like(metadata.get("issuer"))
+
+            # ensure artist is a trimmed string or None
+            if artist:
+                artist = str(artist).strip()
+
+            if buyer and artist and buyer != artist:
+                edges.append({
+                    "source": buyer,
+                    "target": artist,
+                    "token_id": str(token.get("tokenId")),
+                    "contract": token.get("contract", {}).get("address"),
+                    "timestamp": tx.get("timestamp")
+                })
+        except Exception as e:
+            print(f"⚠️ parse error (transfer) tx={tx.get('transactionId')} err={e}")
+            continue
+    return edges, new_creators
+
+async def trace_pages(client, in_q, out_q):
+    """Stage 2: trace each page; a failing page is retried, never skipped (the writer needs every seq)."""
+    while True:
+        seq, collects = await in_q.get()
+        while True:
+            try:
+                edges, new_creators = await trace_collects(client, collects)
+                break
+            except Exception as e:
+                print(f"❌ Trace failed for page ending at ID {collects[-1]['id']}: {e}. Retrying...")
+                await asyncio.sleep(TRACE_RETRY_DELAY)
+        await out_q.put((seq, collects, edges, new_creators))
+        in_q.task_done()
+
+def write_page(conn, collects, edges, new_creators=None):
+    """Persist one page of edges and advance the cursor past it, atomically.
+
+    Edges and cursor share one transaction (one fsync per page): after a crash either
+    both are on disk or neither is, so no page is skipped or applied twice.
+    Returns the number of new edges.
+    """
+    with conn:
+        if new_creators:
+            conn.executemany(INSERT_CREATOR_SQL, [(c, t, creator) for (c, t), creator in new_creators.items()])
+        cur = conn.executemany(INSERT_EDGE_SQL, edges)
+        save_cursor(conn, collects[-1]["id"])
+    return max(cur.rowcount, 0)
+
+async def write_pages(in_q):
+    """Stage 3: commit pages strictly in fetch order, so the cursor never skips a page."""
+    next_seq = 0
+    pending = {}
+    total_synced = 0
+
+    conn = get_db().conn
+    # WAL + NORMAL: commits skip the fsync of the WAL, still atomic and crash-consistent
+    conn.execute("PRAGMA synchronous = NORMAL")
+    while True:
+        seq, collects, edges, new_creators = await in_q.get()
+        pending[seq] = (collects, edges, new_creators)
+        in_q.task_done()
+
+        # tracers may finish out of order; flush the contiguous prefix only
+        while next_seq in pending:
+            collects, edges, new_creators = pending.pop(next_seq)
+            next_seq += 1
+            # The page + cursor transaction rolls back on failure, so retrying the same page is safe
+            delay = 1
+            for attempt in range(1, WRITE_RETRIES + 1):
+                try:
+                    trace_count = write_page(conn, collects, edges, new_creators)
+                    break
+                except sqlite3.OperationalError as e:
+                    if attempt == WRITE_RETRIES:
+                        raise
+                    print(f"⚠️ Write failed for page ending at ID {collects[-1]['id']}: {e}. Retrying in {delay}s...")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30)
+            total_synced += len(collects)
+
+            # --- STEP 4: Human-Readable Output ---
+            # Convert TzKT timestamp (e.g., 2021-03-01T...) to pretty format
+            dt_obj = datetime.strptime(collects[-1]["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
+            pretty_date = dt_obj.strftime("%b %d, %Y")
+            print(f"📅 [{pretty_date}] | 📈 Total Ops: {total_synced} | ✨ New Edges: +{trace_count} | ID: {collects[-1]['id']}")
+
 async def sync_forward():
+    """Fetch -> trace -> write pipeline with bounded queues between the stages.
+
+    The next collect page is fetched while earlier ones are traced and written;
+    `PIPELINE_DEPTH` bounds how far the fetcher can run ahead.
+    """
     print(f"📡 Starting Forward Sync...")
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    # Shared rate-limited client: pacing and retries adapt to what TzKT allows
+    async with TzktClient(timeout=30.0) as client:
         # 1. Initialize Cursor
         cursor_id = await get_starting_cursor(client)
-        start_time = datetime.now()
-        total_synced = 0
-        
-        while True:
-            try:
-                r_collects = await client.get(
-                    "https://api.tzkt.io/v1/operations/transactions",
-                    params={
-                        "target.in": ",".join(TARGETS),
-                        "entrypoint": "collect",
-                        "status": "applied",
-                        "limit": BATCH_SIZE,
-                        "sort.asc": "id",
-                        "id.gt": cursor_id,
-                        "select": "hash,sender,timestamp,id" 
-                    }
-                )
-                
-                if r_collects.status_code != 200:
-                    print(f"⚠️ API Error {r_collects.status_code}. Sleeping...")
-                    await asyncio.sleep(5)
-                    continue
-                
-                collects = r_collects.json()
-                if not collects:
-                    print("💤 caught up to tip. Sleeping 10s...")
-                    await asyncio.sleep(10)
-                    continue
-                
-                # --- Status Prep ---
-                current_batch_time = collects[-1]["timestamp"]
-                # Convert TzKT timestamp (e.g., 2021-03-01T...) to pretty format
-                dt_obj = datetime.strptime(current_batch_time, "%Y-%m-%dT%H:%M:%SZ")
-                pretty_date = dt_obj.strftime("%b %d, %Y")
-
-                # --- STEP 2: Trace Execution (Get Internal Ops) ---
-                group_hashes = list(set([c["hash"] for c in collects]))
-                valid_op_ids = []
-                
-                # Fetch detailed traces for these groups
-                # Processing in mini-batches to prevent URL overflow
-                trace_chunk_size = 10
-                for i in range(0, len(group_hashes), trace_chunk_size):
-                    chunk = group_hashes[i:i + trace_chunk_size]
-                    trace_tasks = [client.get(f"https://api.tzkt.io/v1/operations/{h}") for h in chunk]
-                    responses = await asyncio.gather(*trace_tasks)
-                    
-                    for r in responses:
-                        if r.status_code == 200:
-                            ops = r.json()
-                            valid_op_ids.extend([op["id"] for op in ops])
-                
-                # --- STEP 3: Fetch Resulting Transfers ---
-                trace_count = 0
-                if valid_op_ids:
-                    # Batch fetch transfers (with retries)
-                    t_response = await get_with_retries(client,
-                        "https://api.tzkt.io/v1/tokens/transfers",
-                        params={
-                            "transactionId.in": ",".join(map(str, valid_op_ids)),
-                            "select": "to,token,transactionId,timestamp"
-                        }
-                    )
-
-                    if t_response.status_code == 200:
-                        transfers = t_response.json()
-                        db = get_db() # Get thread-safe connection
-
-                        for tx in transfers:
-                            try:
-                                buyer = tx.get("to", {}).get("address")
-                                token = tx.get("token", {})
-                                metadata = token.get("metadata", {})
-
-                                # Resolve Artist (prefer on-chain canonical minter)
-                                artist = None
-                                token_contract = token.get("contract", {}).get("address")
-                                token_id = token.get("tokenId") or token.get("token_id")
-                                if token_contract and token_id is not None:
-                                    artist = await fetch_canonical_creator(client, token_contract, token_id)
-
-                                # fallback to embedded metadata (handle dict/list shapes safely)
-                                if not artist:
-                                    creators = metadata.get("creators")
-                                    if isinstance(creators, list) and len(creators) > 0:
-                                        artist = _normalize_addr_like(creators[0])
-                                    else:
-                                        artist = _normalize_addr_like(metadata.get("issuer"))
-
-                                # ensure artist is a trimmed string or None
-                                if artist:
-                                    artist = str(artist).strip()
-
-                                if buyer and artist and buyer != artist:
-                                    db["edges"].insert({
-                                        "source": buyer,
-                                        "target": artist,
-                                        "token_id": str(token.get("tokenId")),
-                                        "contract": token.get("contract", {}).get("address"),
-                                        "timestamp": tx.get("timestamp")
-                                    }, pk=("source", "target", "token_id"), replace=True)
-                                    trace_count += 1
-                            except Exception as e:
-                                print(f"⚠️ parse error (transfer) tx={tx.get('transactionId')} err={e}")
-                                continue
-
-                # --- STEP 4: Human-Readable Output ---
-                last_item_id = collects[-1]["id"]
-                await save_cursor(last_item_id)
-                cursor_id = last_item_id
-                total_synced += len(collects)
-                
-                # Progress Bar / Status Line
-                print(f"📅 [{pretty_date}] | 📈 Total Ops: {total_synced} | ✨ New Edges: +{trace_count} | ID: {cursor_id}")
-    
-                await asyncio.sleep(RATE_LIMIT_DELAY)
 
-            except Exception as e:
-                print(f"❌ Crash in loop: {e}")
-                await asyncio.sleep(5)
+        collect_q = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+        traced_q = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(fetch_collect_pages(client, cursor_id, collect_q))
+            for _ in range(TRACE_WORKERS):
+                tg.create_task(trace_pages(client, collect_q, traced_q))
+            tg.create_task(write_pages(traced_q))
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     init_db()
     try:
         asyncio.run(sync_forward())
@@ -1,9 +1,10 @@
 # main.py
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlite_utils import Database
 from pydantic import BaseModel
 from typing import Optional
+import json
+from database import get_read_conn
 
 app = FastAPI(title="Teia Trust MVP")
 
@@ -15,8 +16,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def get_db():
-    return Database("trust_network.db")
+# Constant SQL strings so each worker connection keeps them prepared
+# Reads go to the aggregated `edge_counts` table (one row per source/target pair)
+EDGE_STRENGTH_SQL = "SELECT count FROM edge_counts WHERE source = ? AND target = ?"
+SCORE_SQL = "SELECT score, rank FROM scores WHERE address = ?"
+SCORES_IN_SQL = "SELECT address, score FROM scores WHERE address IN (SELECT value FROM json_each(?))"
+# Split into index-friendly branches: forward PK, forward via my trusts, reverse index
+EGO_EDGES_SQL = """
+    SELECT source, target, count FROM edge_counts WHERE source = :center
+    UNION
+    SELECT e.source, e.target, e.count
+    FROM edge_counts m JOIN edge_counts e ON e.source = m.target
+    WHERE m.source = :center
+    UNION
+    SELECT source, target, count FROM edge_counts WHERE target = :center
+    LIMIT 500
+"""
 
 class TrustSignal(BaseModel):
     observer: str
@@ -29,17 +44,14 @@ class TrustSignal(BaseModel):
 
 @app.get("/trust/{observer_address}/{target_address}", response_model=TrustSignal)
 def get_trust_score(observer_address: str, target_address: str):
-    db = get_db()
+    conn = get_read_conn()
     
     # 1. Direct Trust (Local)
-    matches = list(db["edges"].rows_where(
-        "source = ? AND target = ?", 
-        [observer_address, target_address]
-    ))
-    strength = len(matches)
+    row = conn.execute(EDGE_STRENGTH_SQL, (observer_address, target_address)).fetchone()
+    strength = row[0] if row else 0
     
     # 2. Global Trust (Network Reputation)
-    score_row = db["scores"].get(target_address)
+    score_row = conn.execute(SCORE_SQL, (target_address,)).fetchone()
     global_score = score_row["score"] if score_row else 0.0
     rank = score_row["rank"] if score_row else None
 
@@ -59,20 +71,10 @@ def get_trust_score(observer_address: str, target_address: str):
 
 @app.get("/graph/{center_address}")
 def get_graph_data(center_address: str):
-    db = get_db()
+    conn = get_read_conn()
     
     # Get nodes and edges (Same logic as before)
-    sql = """
-    WITH my_trusts AS (
-        SELECT target FROM edges WHERE source = :center
-    )
-    SELECT * FROM edges 
-    WHERE source = :center 
-       OR source IN (SELECT target FROM my_trusts)
-       OR target = :center
-    LIMIT 500
-    """
-    rows = list(db.query(sql, {"center": center_address}))
+    rows = conn.execute(EGO_EDGES_SQL, {"center": center_address}).fetchall()
     
     nodes = set()
     edges = []
@@ -85,17 +87,13 @@ def get_graph_data(center_address: str):
         nodes.add(tgt)
         
         edges.append({
-            "from": src, "to": tgt, "arrows": "to",
+            "from": src, "to": tgt, "arrows": "to", "value": r["count"],
             "color": {"color": "#4ade80" if src == center_address else "#64748b"}
         })
         
     # Get scores for all these nodes to size them properly
-    # Using 'IN' clause for efficiency
-    placeholders = ",".join(["?"] * len(nodes))
-    score_rows = list(db.query(
-        f"SELECT address, score FROM scores WHERE address IN ({placeholders})", 
-        list(nodes)
-    ))
+    # One JSON array parameter keeps the statement text constant (and prepared)
+    score_rows = conn.execute(SCORES_IN_SQL, (json.dumps(list(nodes)),)).fetchall()
     score_map = {row["address"]: row["score"] for row in score_rows}
 
     node_list = []
@@ -119,9 +117,10 @@ def get_graph_data(center_address: str):
 
 @app.get("/stats")
 def get_stats():
-    db = get_db()
-    if "edges" not in db.table_names(): return {}
+    conn = get_read_conn()
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "edges" not in tables: return {}
     return {
-        "total_edges": db["edges"].count,
-        "total_scored_users": db["scores"].count if "scores" in db.table_names() else 0
+        "total_edges": conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0],
+        "total_scored_users": conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0] if "scores" in tables else 0
     }
\ No newline at end of file
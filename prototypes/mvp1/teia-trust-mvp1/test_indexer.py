@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import database
+import indexer
+
+
+class FakeTzkt:
+    """Just enough of TzktClient.get_json for trace_collects; `fail` first calls raise."""
+
+    def __init__(self, transfers, creators=None, fail=0):
+        self.transfers = transfers
+        self.creators = creators or {}
+        self.fail = fail
+        self.calls = []
+
+    async def get_json(self, url, params=None):
+        self.calls.append(url)
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("HTTP 503")
+        if "/v1/operations/" in url:
+            return [{"id": int(url.rsplit("/o", 1)[1])}]
+        if url.endswith("/v1/tokens/transfers"):
+            return self.transfers
+        if url.endswith("/v1/tokens"):
+            ids = params["tokenId.in"].split(",")
+            return [{"tokenId": t, "firstMinter": {"address": self.creators[t]}} for t in ids if t in self.creators]
+        raise AssertionError(url)
+
+
+def transfer(op_id, buyer, token_id, metadata=None):
+    return {
+        "to": {"address": buyer},
+        "token": {"contract": {"address": "KT1objkt"}, "tokenId": str(token_id), "metadata": metadata or {}},
+        "transactionId": op_id,
+        "timestamp": "2021-06-01T12:00:00Z",
+    }
+
+
+def collect(op_id):
+    return {"hash": f"o{op_id}", "sender": {"address": "tz1buyer"}, "timestamp": "2021-06-01T12:00:00Z", "id": op_id}
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "_local", type(database._local)())
+    indexer._canonical_creator_cache.clear()
+    database.init_db()
+
+
+def test_failed_trace_is_retried_before_the_page_moves_on(monkeypatch):
+    monkeypatch.setattr(indexer, "TRACE_RETRY_DELAY", 0)
+    client = FakeTzkt([transfer(1, "tz1buyer", 7)], creators={"7": "tz1artist"}, fail=1)
+
+    async def run():
+        in_q, out_q = asyncio.Queue(), asyncio.Queue()
+        await in_q.put((0, [collect(1)]))
+        tracer = asyncio.create_task(indexer.trace_pages(client, in_q, out_q))
+        page = await out_q.get()
+        tracer.cancel()
+        return page
+
+    seq, collects, edges, new_creators = asyncio.run(run())
+    assert seq == 0
+    assert [(e["source"], e["target"]) for e in edges] == [("tz1buyer", "tz1artist")]
+    assert new_creators == {("KT1objkt", "7"): "tz1artist"}
+
+
+def test_failed_creator_lookup_fails_the_page():
+    class LookupDown(FakeTzkt):
+        async def get_json(self, url, params=None):
+            if url.endswith("/v1/tokens"):
+                raise RuntimeError("HTTP 503")
+            return await super().get_json(url, params)
+
+    # raising (not returning the page without artists) is what makes trace_pages retry it
+    with pytest.raises(RuntimeError):
+        asyncio.run(indexer.trace_collects(LookupDown([transfer(1, "tz1buyer", 7)]), [collect(1)]))
+
+
+def test_metadata_fallback_does_not_hide_resolved_creators():
+    # token 8 is unknown to TzKT: its artist comes from metadata, before token 7's transfer
+    transfers = [
+        transfer(1, "tz1buyer", 8, metadata={"creators": ["tz1fallback"]}),
+        transfer(2, "tz1buyer", 7),
+    ]
+    client = FakeTzkt(transfers, creators={"7": "tz1artist"})
+
+    edges, _ = asyncio.run(indexer.trace_collects(client, [collect(1), collect(2)]))
+    assert [(e["token_id"], e["target"]) for e in edges] == [("8", "tz1fallback"), ("7", "tz1artist")]
+
+
+def test_unknown_tokens_are_not_persisted():
+    client = FakeTzkt([], creators={"7": "tz1artist"})
+
+    resolved, fresh = asyncio.run(indexer.resolve_creators(client, {("KT1objkt", "7"), ("KT1objkt", "9")}))
+    assert resolved == {("KT1objkt", "7"): "tz1artist", ("KT1objkt", "9"): None}
+    assert fresh == {("KT1objkt", "7"): "tz1artist"}
+
+    # once TzKT knows token 9 it is resolved on the next lookup
+    client.creators["9"] = "tz1minted"
+    resolved, fresh = asyncio.run(indexer.resolve_creators(client, {("KT1objkt", "9")}))
+    assert resolved == fresh == {("KT1objkt", "9"): "tz1minted"}
@@ -1,69 +1,87 @@
 # trust_engine.py
-import networkx as nx
+import time
+import numpy as np
+import scipy.sparse as sp
 from database import get_db, init_db
 
+def sparse_pagerank(src_idx, dst_idx, weights, n, alpha=0.85, tol=1.0e-6, max_iter=100):
+    """Weighted PageRank by power iteration on a CSR matrix.
+
+    Same semantics as `nx.pagerank` (uniform teleport, dangling mass spread
+    uniformly, L1 tolerance scaled by n), but on integer ids and numpy arrays.
+    """
+    W = sp.csr_matrix((weights, (src_idx, dst_idx)), shape=(n, n), dtype=np.float64)
+    out_weight = np.asarray(W.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inv_out = np.zeros(n)
+    inv_out[~dangling] = 1.0 / out_weight[~dangling]
+    # Row-normalise, then transpose once so each step is a single sparse mat-vec
+    M_T = (sp.diags(inv_out) @ W).T.tocsr()
+
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * (M_T @ x_last + x_last[dangling].sum() / n) + (1.0 - alpha) / n
+        if np.abs(x - x_last).sum() < n * tol:
+            break
+    else:
+        print(f"   ⚠️ PageRank did not converge in {max_iter} iterations.")
+    return x
+
 def run_trust_algorithm():
     print("🧠 Starting Trust Calculation Engine...")
+    start_time = time.time()
     db = get_db()
-    
+
     # 1. Load Data into Memory
     print("   Loading graph data...")
-    edges = list(db["edges"].rows)
-    if not edges:
+    # edge_counts is already aggregated per (source, target) by the indexer
+    rows = db.conn.execute("SELECT source, target, count FROM edge_counts").fetchall()
+    if not rows:
         print("   ⚠️ No data found. Run indexer first.")
         return
 
     # 2. Build the Graph
-    G = nx.DiGraph()
-    
-    for e in edges:
-        u = e["source"]
-        v = e["target"]
-        
-        # We assume every collect adds "weight" to the trust relationship
-        if G.has_edge(u, v):
-            G[u][v]['weight'] += 1
-        else:
-            G.add_edge(u, v, weight=1)
+    # Factorise addresses -> dense integer ids in one vectorised pass
+    sources, targets, counts = zip(*rows)
+    addresses, inverse = np.unique(np.array(sources + targets, dtype=str), return_inverse=True)
+    src_idx, dst_idx = inverse[:len(rows)], inverse[len(rows):]
+    # We assume every collect adds "weight" to the trust relationship
+    weights = np.array(counts, dtype=np.float64)
+    n = len(addresses)
 
-    print(f"   Graph Built: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges.")
+    print(f"   Graph Built: {n} nodes, {len(rows)} edges.")
 
     # 3. Run PageRank (The Core Algorithm)
     # alpha=0.85 means there's a 15% chance of jumping to a random node (damping factor)
     # We use 'weight' so buying 10 items is stronger than buying 1.
     print("   Computing PageRank...")
-    scores = nx.pagerank(G, alpha=0.85, weight='weight')
+    scores = sparse_pagerank(src_idx, dst_idx, weights, n, alpha=0.85)
 
     # 4. Normalize and Store
     # We verify the top score to normalize everyone else against it (0-100 scale usually better for UI)
-    if scores:
-        max_score = max(scores.values())
-    else:
-        max_score = 1.0
+    max_score = scores.max() if n else 1.0
+    normalized = scores / max_score * 100
 
     print("   Saving scores to DB...")
-    
-    # Prepare batch for insertion
-    batch_data = []
+
     # Sort by score desc to assign rank
-    sorted_items = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    
-    for rank, (address, raw_score) in enumerate(sorted_items, 1):
-        # Normalize to 0-100 for human readability
-        normalized_score = (raw_score / max_score) * 100
-        
-        batch_data.append({
-            "address": address,
-            "score": normalized_score,
-            "rank": rank
-        })
+    order = np.argsort(-scores, kind="stable")
+    batch_data = [
+        (str(addresses[i]), float(normalized[i]), rank)
+        for rank, i in enumerate(order.tolist(), 1)
+    ]
+
+    # Bulk upsert in one transaction (Replace old scores)
+    with db.conn:
+        db.conn.executemany("""
+            INSERT INTO scores (address, score, rank) VALUES (?, ?, ?)
+            ON CONFLICT (address) DO UPDATE SET score = excluded.score, rank = excluded.rank
+        """, batch_data)
 
-    # Upsert into DB (Replace old scores)
-    db["scores"].insert_all(batch_data, pk="address", replace=True)
-    
-    print(f"✅ Calculated scores for {len(batch_data)} users.")
-    print(f"   🏆 Top Trust: {sorted_items[0][0]} (Score: 100)")
+    print(f"✅ Calculated scores for {len(batch_data)} users in {time.time() - start_time:.2f}s.")
+    print(f"   🏆 Top Trust: {batch_data[0][0]} (Score: 100)")
 
 if __name__ == "__main__":
     init_db()
-    run_trust_algorithm()
\ No newline at end of file
+    run_trust_algorithm()
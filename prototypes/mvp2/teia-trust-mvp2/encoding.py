@@ -0,0 +1,206 @@
+"""Response encoding for the heavy graph endpoints.
+- Fast JSON via `orjson` when installed (stdlib `json` fallback).
+- Optional compact layouts: `columnar` (parallel arrays, JSON) and `msgpack` (parallel arrays, binary).
+- gzip / brotli negotiation from `Accept-Encoding`.
+- Encoded bodies are built once and cached per (key, graph/score version).
+"""
+from __future__ import annotations
+
+import gzip
+import json
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+try:
+    import orjson
+    _HAS_ORJSON = True
+except Exception:
+    orjson = None
+    _HAS_ORJSON = False
+
+try:
+    import msgpack
+    _HAS_MSGPACK = True
+except Exception:
+    msgpack = None
+    _HAS_MSGPACK = False
+
+try:
+    import brotli
+    _HAS_BROTLI = True
+except Exception:
+    brotli = None
+    _HAS_BROTLI = False
+
+FORMATS = ("json", "columnar", "msgpack")
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+# Bodies smaller than this are sent uncompressed (headers would eat the win)
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps_json(obj: Any) -> bytes:
+    if _HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _columns(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    if not rows:
+        return {}
+    keys = list(rows[0].keys())
+    return {k: [r.get(k) for r in rows] for k in keys}
+
+
+def to_columnar(graph: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn `{'nodes': [...], 'edges': [...]}` into parallel arrays per field.
+    e.g. `nodes.id[i]`, `nodes.score[i]`, `edges.from[j]`, `edges.to[j]`.
+    """
+    nodes = graph.get("nodes", [])
+    edges = graph.get("edges", [])
+    return {
+        "layout": "columnar",
+        "node_count": len(nodes),
+        "edge_count": len(edges),
+        "nodes": _columns(nodes),
+        "edges": _columns(edges),
+    }
+
+
+def encode_body(payload: Dict[str, Any], fmt: str) -> bytes:
+    if fmt == "msgpack":
+        if not _HAS_MSGPACK:
+            raise ValueError("msgpack format requested but msgpack is not installed")
+        return msgpack.packb(to_columnar(payload), use_bin_type=True)
+    if fmt == "columnar":
+        return dumps_json(to_columnar(payload))
+    return dumps_json(payload)
+
+
+def compress_body(body: bytes, coding: Optional[str]) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if coding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def negotiate_format(fmt: Optional[str], accept: Optional[str]) -> str:
+    """Explicit `?format=` wins; otherwise `Accept: application/msgpack` selects msgpack."""
+    if fmt:
+        fmt = fmt.lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"unsupported format '{fmt}' (expected one of {', '.join(FORMATS)})")
+        if fmt == "msgpack" and not _HAS_MSGPACK:
+            raise ValueError("msgpack format is not available on this server")
+        return fmt
+    if accept and _HAS_MSGPACK and ("application/msgpack" in accept or "application/x-msgpack" in accept):
+        return "msgpack"
+    return "json"
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick `br` (if brotli is installed) or `gzip` from an Accept-Encoding header, honouring q=0."""
+    if not accept_encoding:
+        return None
+    offered = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            offered[token.strip().lower()] = q
+    wildcard = offered.get("*", 0.0)
+    if _HAS_BROTLI and offered.get("br", wildcard) > 0:
+        return "br"
+    if offered.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _Entry:
+    __slots__ = ("payload", "bodies")
+
+    def __init__(self, payload: Dict[str, Any]) -> None:
+        self.payload = payload
+        self.bodies: Dict[Tuple[str, Optional[str]], Tuple[bytes, Optional[str]]] = {}
+
+
+class EncodedResponseCache:
+    """Small LRU of built payloads and their encoded/compressed bodies.
+
+    Entries are keyed by (endpoint key, data version) so a new graph load or engine
+    run naturally invalidates everything computed against the old version.
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Any, Hashable], _Entry]" = OrderedDict()
+        self._version: Optional[Hashable] = None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_body(
+        self,
+        key: Any,
+        version: Hashable,
+        fmt: str,
+        coding: Optional[str],
+        build: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[bytes, Optional[str]]:
+        """Return `(body, content_encoding)` for the request, building/encoding only on a miss."""
+        if version != self._version:
+            # older versions can never be served again
+            self._entries.clear()
+            self._version = version
+
+        cache_key = (key, version)
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            payload = await build()
+            if version != self._version:
+                # graph or scores changed while we were building; serve but don't cache
+                body = encode_body(payload, fmt)
+                return _maybe_compress(body, coding)
+            entry = _Entry(payload)
+            self._entries[cache_key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(cache_key)
+
+        variant = (fmt, coding)
+        cached = entry.bodies.get(variant)
+        if cached is None:
+            cached = _maybe_compress(encode_body(entry.payload, fmt), coding)
+            entry.bodies[variant] = cached
+        return cached
+
+
+def _maybe_compress(body: bytes, coding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    if coding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    return compress_body(body, coding), coding
+
+
+__all__ = [
+    "EncodedResponseCache",
+    "MEDIA_TYPES",
+    "dumps_json",
+    "encode_body",
+    "negotiate_encoding",
+    "negotiate_format",
+    "to_columnar",
+]
@@ -1,4 +1,5 @@
 import asyncio
+import asyncpg
 from database import get_index_conn, get_app_conn
 import time
 
@@ -14,6 +15,11 @@ async def init_score_table():
                 last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
             CREATE INDEX IF NOT EXISTS idx_trust_scores_rank ON trust_scores(rank);
+            CREATE TABLE IF NOT EXISTS trust_meta (
+                key TEXT PRIMARY KEY,
+                value BIGINT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
         """)
 
 class TrustEngine:
@@ -23,12 +29,35 @@ class TrustEngine:
         self._gsvc = TrustGraph()
         self.global_scores = {}
         self.nodes_loaded = False
+        # bumped on every graph (re)load; response caches key on it
+        self.version = 0
+        # mirrors trust_meta.score_version, bumped by each engine run
+        self.score_version = 0
+
+    @property
+    def data_version(self) -> str:
+        """Combined graph/score version used for ETags and response caches."""
+        return f"{self.version}.{self.score_version}"
+
+    async def refresh_score_version(self) -> bool:
+        """Re-read the score version written by the last engine run. Returns True if it changed."""
+        try:
+            async with get_app_conn() as conn:
+                value = await conn.fetchval("SELECT value FROM trust_meta WHERE key = 'score_version'")
+        except asyncpg.exceptions.UndefinedTableError:
+            # engine has never run against this app DB
+            return False
+        if value is None or value == self.score_version:
+            return False
+        self.score_version = value
+        return True
 
     async def load_graph(self):
         print("📥 Loading graph via TrustGraph (rustworkx)...")
         await self._gsvc.load_from_index_db()
         # TrustGraph maps node indices -> DB ids via rev_node_map
         self.nodes_loaded = getattr(self._gsvc, "_nodes_loaded", False)
+        self.version += 1
         if not self.nodes_loaded:
             print("⚠️ No trust connections found.")
             return
@@ -86,6 +115,12 @@ async def run_trust_algorithm():
                 INSERT INTO trust_scores (holder_id, score, rank)
                 SELECT holder_id, score, rank FROM tmp_scores
             """)
+            # let running APIs invalidate ETags / cached responses
+            await conn.execute("""
+                INSERT INTO trust_meta (key, value) VALUES ('score_version', 1)
+                ON CONFLICT (key) DO UPDATE
+                SET value = trust_meta.value + 1, updated_at = CURRENT_TIMESTAMP
+            """)
             
     end_time = time.time()
     print(f"✅ Trust Engine completed in {end_time - start_time:.2f} seconds.")
@@ -0,0 +1,41 @@
+"""Conditional GET helpers.
+ETags are derived from (endpoint, params, data version) only, so a matching
+`If-None-Match` can be answered with a 304 before any DB or graph work.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Hashable, Iterable, Optional
+
+from fastapi import Response
+
+# Clients may keep the body but must revalidate; the 304 path is nearly free
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(endpoint: str, params: Iterable[Any], version: Hashable) -> str:
+    raw = repr((endpoint, tuple(params), version)).encode("utf-8")
+    # weak: the same resource may be served gzip/br/identity encoded
+    return 'W/"' + hashlib.blake2b(raw, digest_size=12).hexdigest() + '"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    want = _opaque(etag)
+    return any(_opaque(t) == want for t in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+__all__ = ["CACHE_CONTROL", "etag_matches", "make_etag", "not_modified"]
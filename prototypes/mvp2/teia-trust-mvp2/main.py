@@ -1,21 +1,43 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from database import get_index_conn, get_app_conn
 from typing import Optional, List
 from pydantic import BaseModel
 from engine import TrustEngine
+from encoding import EncodedResponseCache, MEDIA_TYPES, negotiate_encoding, negotiate_format
+from http_cache import CACHE_CONTROL, etag_matches, make_etag, not_modified
+from singleflight import SingleFlight
 import asyncio
+import os
 
 app = FastAPI(title="Teia Trust API MVP2 (Multi-DB)")
 
 # Global engine instance
 engine = TrustEngine()
 
+# Pre-encoded /graph bodies, invalidated whenever the graph or scores change
+graph_cache = EncodedResponseCache(max_entries=256)
+
+# Concurrent identical PPR / profile / graph computations share one in-flight task
+inflight = SingleFlight()
+
+# How often to pick up score versions written by `engine.py` runs
+SCORE_VERSION_POLL_SECONDS = float(os.getenv("SCORE_VERSION_POLL_SECONDS", "15"))
+
+async def poll_score_version():
+    while True:
+        try:
+            await engine.refresh_score_version()
+        except Exception as e:
+            print(f"⚠️ score version poll failed: {e}")
+        await asyncio.sleep(SCORE_VERSION_POLL_SECONDS)
+
 @app.on_event("startup")
 async def startup_event():
     # Pre-load the graph into memory for fast PPR calculations
     # In a prod environment, we'd do this in a background task
     asyncio.create_task(engine.load_graph())
+    asyncio.create_task(poll_score_version())
 
 class Profile(BaseModel):
     address: str
@@ -61,6 +83,16 @@ class TrustResponse(BaseModel):
     reason: str
 
 async def get_profile(address_or_id: str | int) -> Profile:
+    return await inflight.do(("profile", address_or_id), lambda: _fetch_profile(address_or_id))
+
+async def get_ppr(seed_id: int) -> dict:
+    """Personalized PageRank for `seed_id`, off the event loop and coalesced per seed/graph version."""
+    return await inflight.do(
+        ("ppr", seed_id, engine.version),
+        lambda: asyncio.to_thread(engine.compute_personalized_pagerank, seed_id),
+    )
+
+async def _fetch_profile(address_or_id: str | int) -> Profile:
     # 1. Fetch metadata from INDEX DB - Keep it simple, just holder table
     async with get_index_conn() as conn:
         if isinstance(address_or_id, str) and address_or_id.startswith('tz'):
@@ -121,7 +153,13 @@ async def get_profile(address_or_id: str | int) -> Profile:
     )
 
 @app.get("/trust/{observer_address}/{target_address}", response_model=TrustResponse)
-async def get_trust(observer_address: str, target_address: str):
+async def get_trust(request: Request, response: Response, observer_address: str, target_address: str):
+    etag = make_etag("trust", (observer_address, target_address), engine.data_version)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
     obs = await get_profile(observer_address)
     tgt = await get_profile(target_address)
     
@@ -164,12 +202,48 @@ async def get_trust(observer_address: str, target_address: str):
     }
 
 @app.get("/graph/{address}")
-async def get_graph(address: str, tag: Optional[str] = None, max_first: int = 60, max_second: int = 80):
+async def get_graph(
+    request: Request,
+    address: str,
+    tag: Optional[str] = None,
+    max_first: int = 60,
+    max_second: int = 80,
+    fmt: Optional[str] = Query(None, alias="format"),
+):
+    """Ego graph around `address`.
+
+    `?format=json` (default) returns node/edge dicts, `columnar` returns parallel arrays
+    and `msgpack` the same columnar layout as MessagePack. Bodies are gzip/brotli
+    compressed per `Accept-Encoding` and cached per graph/score version.
+    """
+    try:
+        out_fmt = negotiate_format(fmt, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    version = engine.data_version
+    key = ("graph", address, tag, max_first, max_second)
+    etag = make_etag("graph", key[1:] + (out_fmt,), version)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+
+    coding = negotiate_encoding(request.headers.get("accept-encoding"))
+    body, content_encoding = await graph_cache.get_body(
+        key, version, out_fmt, coding,
+        lambda: inflight.do(("graph", key, version), lambda: build_graph(address, tag, max_first, max_second)),
+    )
+
+    headers = {"Vary": "Accept, Accept-Encoding", "ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type=MEDIA_TYPES[out_fmt], headers=headers)
+
+async def build_graph(address: str, tag: Optional[str], max_first: int, max_second: int) -> dict:
     center = await get_profile(address)
     
     # Compute Subjective Scores (Personalized PageRank)
     # This identifies "who matters to YOU" specifically
-    ppr = engine.compute_personalized_pagerank(center.id)
+    ppr = await get_ppr(center.id)
     max_ppr = max(ppr.values()) if ppr else 0.00001
     
     async with get_index_conn() as idx_conn:
@@ -0,0 +1,43 @@
+"""Request coalescing ("single-flight") for expensive async computations.
+Concurrent callers asking for the same key share one in-flight task instead of
+each running their own copy (PPR per seed, profile lookups per address, ...).
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls by key.
+
+    The shared computation runs as its own task, so a caller that is cancelled
+    (e.g. client disconnect) does not cancel the work for everyone else. Results
+    are not cached: once the task finishes the key is free again.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+
+__all__ = ["SingleFlight"]
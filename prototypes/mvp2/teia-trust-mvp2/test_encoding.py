@@ -0,0 +1,105 @@
+import asyncio
+import gzip
+
+import pytest
+
+import encoding
+from encoding import EncodedResponseCache, negotiate_encoding, negotiate_format
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(encoding, "_HAS_BROTLI", True)
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(encoding, "_HAS_BROTLI", False)
+
+
+def test_no_accept_encoding_means_identity():
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("identity") is None
+
+
+def test_brotli_preferred_when_installed(with_brotli):
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("GZIP ; q=0.5, BR ; q=0.1") == "br"
+
+
+def test_gzip_without_brotli(without_brotli):
+    assert negotiate_encoding("gzip, deflate, br") == "gzip"
+    assert negotiate_encoding("br") is None
+
+
+def test_q_zero_refuses_a_coding(with_brotli):
+    assert negotiate_encoding("br;q=0, gzip") == "gzip"
+    assert negotiate_encoding("br;q=0, gzip;q=0.0") is None
+    # unparseable q-value counts as a refusal
+    assert negotiate_encoding("br;q=high, gzip;q=0.8") == "gzip"
+
+
+def test_wildcard_covers_unlisted_codings(with_brotli):
+    assert negotiate_encoding("*") == "br"
+    assert negotiate_encoding("br;q=0, *;q=0.5") == "gzip"
+    assert negotiate_encoding("*;q=0") is None
+    # an explicit entry beats the wildcard
+    assert negotiate_encoding("*;q=0, gzip") == "gzip"
+
+
+def test_explicit_format_wins_over_accept():
+    assert negotiate_format("COLUMNAR", "application/msgpack") == "columnar"
+    assert negotiate_format("json", "application/msgpack") == "json"
+    with pytest.raises(ValueError):
+        negotiate_format("xml", None)
+
+
+def test_accept_selects_msgpack(monkeypatch):
+    monkeypatch.setattr(encoding, "_HAS_MSGPACK", True)
+    assert negotiate_format(None, "application/msgpack, application/json;q=0.9") == "msgpack"
+    assert negotiate_format(None, "application/x-msgpack") == "msgpack"
+    assert negotiate_format(None, "application/json") == "json"
+    assert negotiate_format(None, None) == "json"
+
+
+def test_msgpack_unavailable(monkeypatch):
+    monkeypatch.setattr(encoding, "_HAS_MSGPACK", False)
+    assert negotiate_format(None, "application/msgpack") == "json"
+    with pytest.raises(ValueError):
+        negotiate_format("msgpack", None)
+
+
+def test_cache_builds_once_and_compresses_large_bodies():
+    cache = EncodedResponseCache()
+    calls = []
+
+    async def build():
+        calls.append(1)
+        return {"nodes": [{"id": i, "score": 0.5} for i in range(200)], "edges": []}
+
+    async def run():
+        gz, coding = await cache.get_body("graph", 1, "json", "gzip", build)
+        plain, plain_coding = await cache.get_body("graph", 1, "json", None, build)
+        return gz, coding, plain, plain_coding
+
+    gz, coding, plain, plain_coding = asyncio.run(run())
+    assert len(calls) == 1
+    assert coding == "gzip" and plain_coding is None
+    assert gzip.decompress(gz) == plain
+
+
+def test_cache_rebuilds_on_new_version():
+    cache = EncodedResponseCache()
+    versions = iter([1, 2])
+
+    async def build():
+        return {"nodes": [{"v": next(versions)}], "edges": []}
+
+    async def run():
+        first, _ = await cache.get_body("graph", 1, "json", None, build)
+        second, _ = await cache.get_body("graph", 2, "json", None, build)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first != second
@@ -0,0 +1,50 @@
+from http_cache import CACHE_CONTROL, etag_matches, make_etag, not_modified
+
+
+def test_etag_is_weak_and_stable():
+    etag = make_etag("graph", ("tz1a", 2, "json"), 7)
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert make_etag("graph", ("tz1a", 2, "json"), 7) == etag
+    assert make_etag("graph", ("tz1a", 3, "json"), 7) != etag
+    assert make_etag("trust", ("tz1a", 2, "json"), 7) != etag
+
+
+def test_data_version_change_invalidates():
+    old = make_etag("trust", ("tz1a", "tz1b"), (1, 1))
+    new = make_etag("trust", ("tz1a", "tz1b"), (1, 2))
+    assert new != old
+    assert not etag_matches(old, new)
+
+
+def test_weak_comparison():
+    etag = make_etag("graph", (), 1)
+    strong = etag[2:]
+    assert etag_matches(etag, etag)
+    # If-None-Match uses weak comparison: W/ prefixes on either side are ignored
+    assert etag_matches(strong, etag)
+    assert etag_matches(etag, strong)
+    assert not etag_matches('W/"other"', etag)
+
+
+def test_wildcard_and_lists():
+    etag = make_etag("graph", (), 1)
+    assert etag_matches("*", etag)
+    assert etag_matches(" * ", etag)
+    assert etag_matches(f'"a", {etag}', etag)
+    assert etag_matches(f'W/"a",{etag[2:]} , "b"', etag)
+    assert not etag_matches('"a", W/"b"', etag)
+
+
+def test_missing_header_never_matches():
+    etag = make_etag("graph", (), 1)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+
+
+def test_not_modified_response():
+    etag = make_etag("graph", (), 1)
+    response = not_modified(etag)
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == CACHE_CONTROL
+    assert response.body == b""
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("seed", compute) for _ in range(5)))
+        return results, len(flight)
+
+    results, inflight = asyncio.run(run())
+    assert results == [42] * 5
+    assert calls == [1]
+    assert inflight == 0
+
+
+def test_exception_reaches_every_waiter_and_frees_the_key():
+    flight = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def ok():
+        return "recovered"
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("seed", fail) for _ in range(3)), return_exceptions=True)
+        assert len(flight) == 0
+        # the failure is not cached: the next call runs again
+        return results, await flight.do("seed", ok)
+
+    results, retried = asyncio.run(run())
+    assert calls == [1]
+    assert all(isinstance(r, RuntimeError) and str(r) == "boom" for r in results)
+    assert retried == "recovered"
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("seed", compute))
+        second = asyncio.ensure_future(flight.do("seed", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_distinct_keys_run_separately():
+    flight = SingleFlight()
+    calls = []
+
+    async def compute(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    async def run():
+        return await asyncio.gather(flight.do("a", lambda: compute("a")), flight.do("b", lambda: compute("b")))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
@@ -0,0 +1,175 @@
+"""Columnar export of teia_index.db for analytics.
+- `events` is exported incrementally (op_id cursor) into Hive-style partitions:
+  `events/month=YYYY-MM/market=V1/part-<from>-<to>.parquet`
+- `tokens` and `holders` are rewritten as zstd Parquet snapshots each run.
+- Reads through a read-only connection, so it never blocks the indexer.
+
+Query with DuckDB / pandas / polars, e.g.
+    SELECT market, sum(price_mutez) / 1e6 FROM read_parquet('export/events/**/*.parquet', hive_partitioning=1)
+    WHERE type = 'SALE' GROUP BY market;
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DB_FILE = "teia_index.db"
+EXPORT_DIR = "export"
+STATE_FILE = "_export_state.json"
+FETCH_ROWS = 100_000
+COMPRESSION = "zstd"
+
+EVENTS_SCHEMA = pa.schema([
+    ("op_hash", pa.string()),
+    ("op_id", pa.int64()),
+    ("timestamp", pa.timestamp("s", tz="UTC")),
+    ("type", pa.string()),
+    ("token_id", pa.int64()),
+    ("seller", pa.string()),
+    ("buyer", pa.string()),
+    ("amount", pa.int64()),
+    ("price_mutez", pa.int64()),
+    ("swap_id", pa.int64()),
+])
+TOKENS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("minter", pa.string()),
+    ("title", pa.string()),
+    ("artifact_uri", pa.string()),
+    ("metadata_uri", pa.string()),
+    ("royalties", pa.int64()),
+    ("supply", pa.int64()),
+])
+HOLDERS_SCHEMA = pa.schema([
+    ("token_id", pa.int64()),
+    ("address", pa.string()),
+    ("amount", pa.int64()),
+])
+
+
+def get_read_conn(db_file: str) -> sqlite3.Connection:
+    return sqlite3.connect(Path(db_file).resolve().as_uri() + "?mode=ro", uri=True)
+
+
+def load_export_state(out: Path) -> dict:
+    try:
+        return json.loads((out / STATE_FILE).read_text())
+    except FileNotFoundError:
+        return {"events_op_id": 0}
+
+
+def save_export_state(out: Path, state: dict):
+    tmp = out / (STATE_FILE + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    os.replace(tmp, out / STATE_FILE)
+
+
+def _to_batch(rows, schema: pa.Schema) -> pa.RecordBatch:
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_timestamp(field.type):
+            arrays.append(pa.array(values, pa.string()).cast(field.type))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_events(conn: sqlite3.Connection, out: Path, state: dict) -> int:
+    """Append events with op_id in (last exported, indexer's contiguous cursor]."""
+    lo = state.get("events_op_id", 0)
+    row = conn.execute("SELECT value FROM state WHERE key='last_op_id'").fetchone()
+    # last_op_id only covers fully-synced history (partitioned backfills fill gaps below it)
+    hi = row[0] if row else 0
+    if hi <= lo:
+        print(f"💤 events: nothing new after op_id {lo}")
+        return 0
+
+    # Remove partial files of an interrupted run over the same starting point
+    for stale in glob.glob(str(out / "events" / "*" / "*" / f"part-{lo:012d}-*.parquet")):
+        os.remove(stale)
+
+    writers = {}
+    total = 0
+    cur = conn.execute("""
+        SELECT substr(timestamp, 1, 7), contract,
+               op_hash, op_id, timestamp, type, token_id, seller, buyer, amount, price_mutez, swap_id
+        FROM events WHERE op_id > ? AND op_id <= ? ORDER BY op_id
+    """, (lo, hi))
+    try:
+        while True:
+            rows = cur.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            groups = {}
+            for r in rows:
+                groups.setdefault((r[0], r[1]), []).append(r[2:])
+            for (month, market), part in groups.items():
+                writer = writers.get((month, market))
+                if writer is None:
+                    path = out / "events" / f"month={month}" / f"market={market}" / f"part-{lo:012d}-{hi:012d}.parquet"
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    writer = pq.ParquetWriter(path, EVENTS_SCHEMA, compression=COMPRESSION)
+                    writers[(month, market)] = writer
+                writer.write_batch(_to_batch(part, EVENTS_SCHEMA))
+            total += len(rows)
+            print(f"   -> events: {total:,} rows...", end="\r")
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    state["events_op_id"] = hi
+    print(f"✅ events: {total:,} rows in {len(writers)} partitions (op_id {lo} -> {hi})")
+    return total
+
+
+def export_snapshot(conn: sqlite3.Connection, out: Path, table: str, schema: pa.Schema) -> int:
+    """Rewrite `<table>/snapshot.parquet`; readers only ever see a complete file."""
+    path = out / table / "snapshot.parquet"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".parquet.tmp")
+    cur = conn.execute(f"SELECT {', '.join(schema.names)} FROM {table}")
+    total = 0
+    with pq.ParquetWriter(tmp, schema, compression=COMPRESSION) as writer:
+        while True:
+            rows = cur.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            writer.write_batch(_to_batch(rows, schema))
+            total += len(rows)
+    os.replace(tmp, path)
+    print(f"✅ {table}: {total:,} rows")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export teia_index.db to partitioned Parquet")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--out", default=EXPORT_DIR)
+    parser.add_argument("--skip-snapshots", action="store_true", help="Only append new events")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    conn = get_read_conn(args.db)
+    state = load_export_state(out)
+
+    print(f"📦 Exporting {args.db} -> {out}/")
+    export_events(conn, out, state)
+    if not args.skip_snapshots:
+        export_snapshot(conn, out, "tokens", TOKENS_SCHEMA)
+        export_snapshot(conn, out, "holders", HOLDERS_SCHEMA)
+
+    state["exported_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    save_export_state(out, state)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
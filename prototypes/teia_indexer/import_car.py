@@ -0,0 +1,83 @@
+"""Bulk-import token metadata from local CAR archives (pinned / exported HEN+Teia metadata).
+- Matches `tokens.metadata_uri` CIDs against the archive blocks (one mmap'd pass per archive).
+- Parses the JSON with the metadata worker's parser and writes IMPORT_BATCH tokens per
+  transaction through `write_results`, so imported tokens also leave `metadata_jobs`.
+- Bodies also go into the CID cache, which the worker and the DipDup hook read first.
+Whatever isn't in the archives is left to metadata_worker.py.
+
+    uv run import_car.py hen-metadata-0.car hen-metadata-1.car
+"""
+import argparse
+import json
+import time
+
+from car_archive import iter_files, uri_multihash
+from metadata_worker import CID_CACHE, get_db, init_jobs, parse_token_metadata, write_results
+
+IMPORT_BATCH = 5000  # Tokens per transaction
+
+
+def load_wanted(conn, include_synced: bool):
+    """multihash -> (cid as written in the URI, [token ids]); URIs with paths are skipped."""
+    where = "metadata_uri LIKE 'ipfs://%'"
+    if not include_synced:
+        where += " AND title IN ('Unknown', 'FAILED')"
+    wanted, skipped = {}, 0
+    for tid, uri in conn.execute(f"SELECT id, metadata_uri FROM tokens WHERE {where}"):
+        mh = uri_multihash(uri)
+        if mh is None:
+            skipped += 1
+            continue
+        wanted.setdefault(mh, (uri[len("ipfs://"):].strip("/"), []))[1].append(tid)
+    return wanted, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import token metadata from CAR archives")
+    parser.add_argument("archives", nargs="+", help="CARv1/CARv2 files")
+    parser.add_argument("--all", action="store_true", help="Also re-import tokens that already have metadata")
+    args = parser.parse_args()
+
+    conn = get_db()
+    init_jobs(conn)
+    wanted, skipped = load_wanted(conn, args.all)
+    tokens_wanted = sum(len(ids) for _, ids in wanted.values())
+    print(f"📦 Looking for {len(wanted):,} CIDs ({tokens_wanted:,} tokens) in {len(args.archives)} archive(s)")
+    if skipped:
+        print(f"   ({skipped:,} URIs with paths / unknown CID encodings left to the worker)")
+
+    batch = []
+    imported = bad = cids = 0
+    started = time.time()
+    for mh, _, body in iter_files(args.archives, set(wanted)):
+        cid, ids = wanted.pop(mh)
+        try:
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+            rows = [parse_token_metadata(tid, data) for tid in ids]
+        except (ValueError, TypeError, AttributeError):
+            bad += 1
+            continue
+        if CID_CACHE:
+            CID_CACHE.put(cid, body)
+        cids += 1
+        batch.extend(rows)
+        if len(batch) >= IMPORT_BATCH:
+            imported += write_results(conn, batch)
+            batch = []
+            rate = imported / max(time.time() - started, 1e-6)
+            print(f"   -> {imported:,} tokens imported ({rate:,.0f}/s)...", end="\r")
+    if batch:
+        imported += write_results(conn, batch)
+    conn.close()
+
+    print(f"\n✅ Imported {imported:,} tokens from {cids:,} CIDs in {time.time() - started:.1f}s")
+    if bad:
+        print(f"⚠️  {bad:,} CIDs were not valid metadata JSON")
+    if wanted:
+        print(f"💤 {len(wanted):,} CIDs not in the archives; run metadata_worker.py for the rest")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,73 @@
+import argparse
 import sqlite3
 import time
+from pathlib import Path
 
-while True:
-    conn = sqlite3.connect("teia_index.db")
-    c = conn.cursor()
-    
-    # Get Counts
-    tokens = c.execute("SELECT count(*) FROM tokens").fetchone()[0]
-    holders = c.execute("SELECT count(*) FROM holders").fetchone()[0]
-    events = c.execute("SELECT count(*) FROM events").fetchone()[0]
-    
-    # Get Progress Cursors
-    try:
-        token_cursor = c.execute("SELECT value FROM state WHERE key='token_offset'").fetchone()[0]
-        event_cursor = c.execute("SELECT value FROM state WHERE key='last_op_id'").fetchone()[0]
-    except:
-        token_cursor, event_cursor = 0, 0
-
-    print(f"\r📊 Status: {tokens:,} Tokens | {holders:,} Owners | {events:,} Sales/Listings | Cursor: {event_cursor}", end="")
-    conn.close()
-    time.sleep(5)
\ No newline at end of file
+DB_FILE = "teia_index.db"
+
+# Reads only the small `state` table: row counters, throughput samples and cursors are
+# maintained by teia_indexer.py in each batch commit, so no count(*) scans here.
+
+def read_state(conn):
+    return dict(conn.execute("SELECT key, value FROM state").fetchall())
+
+def fmt_eta(seconds):
+    if seconds is None:
+        return "--"
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
+
+def history_progress(state):
+    """(op ids left to sync, ETA seconds) for the market history."""
+    head = state.get('head_op_id')
+    if head is None:
+        return None, None
+    n = state.get('backfill_partitions')
+    if n:
+        # partitioned backfill: work left is the sum of every range's remainder
+        lag = sum(max(0, state[f'backfill_{i}_end'] - state[f'backfill_{i}_cursor']) for i in range(n))
+    else:
+        lag = max(0, head - state.get('last_op_id', 0))
+    rate = state.get('rate_op_id') or 0
+    return lag, (lag / rate if rate > 0 else None)
+
+def snapshot_progress(state, table):
+    head = state.get(f'head_{table}')
+    count = state.get(f'count_{table}', 0)
+    if not head or count >= head:
+        return ""
+    rate = state.get(f'rate_{table}') or 0
+    eta = (head - count) / rate if rate > 0 else None
+    return f" ({count / head:.0%}, ETA {fmt_eta(eta)})"
+
+def main():
+    parser = argparse.ArgumentParser(description="Live teia_indexer progress")
+    parser.add_argument("--interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(Path(DB_FILE).resolve().as_uri() + "?mode=ro", uri=True)
+    while True:
+        state = read_state(conn)
+        tokens = state.get('count_tokens', 0)
+        holders = state.get('count_holders', 0)
+        events = state.get('count_events', 0)
+        lag, eta = history_progress(state)
+        age = int(time.time() - state['progress_ts']) if 'progress_ts' in state else None
+
+        line = (
+            f"\r📊 {tokens:,} Tokens{snapshot_progress(state, 'tokens')} | "
+            f"{holders:,} Owners{snapshot_progress(state, 'holders')} | "
+            f"{events:,} Sales/Listings @ {state.get('rate_events', 0):,.0f}/s | "
+            f"Cursor: {state.get('last_op_id', 0)}"
+        )
+        if lag is not None:
+            line += f" | Lag: {lag:,} op ids, ETA {fmt_eta(eta)}"
+        if age is not None and age > 60:
+            line += f" | last batch {fmt_eta(age)} ago"
+        print(line + "   ", end="")
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Latency-scored, hedged IPFS gateway selection.
+
+- Per gateway: EWMA latency, EWMA error rate, recent latency samples (for p90) and a
+  429 cooldown (`Retry-After` aware).
+- Requests go to the best-scoring gateway; if it hasn't answered by its p90 latency a
+  hedged request goes to the next best, and whichever answers first wins (the other
+  is cancelled). Failures move on to the next gateway immediately.
+- Transport-agnostic: callers pass `fetch_one(gateway)`. The DipDup project has its
+  own copy in `teia_ecosystem_indexer/ipfs_gateways.py`.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+EWMA_ALPHA = 0.2
+DEFAULT_LATENCY = 0.5        # optimistic prior so unseen gateways get tried
+DEFAULT_HEDGE_DELAY = 1.0    # until a gateway has enough samples for a p90
+MIN_HEDGE_DELAY = 0.2
+MIN_SAMPLES_FOR_P90 = 5
+DEFAULT_COOLDOWN = 30.0      # 429 without Retry-After
+ERROR_PENALTY = 4.0          # score = latency * (1 + ERROR_PENALTY * error_rate)
+
+
+class GatewayThrottled(Exception):
+    """Raised by `fetch_one` on a 429 so the gateway is put on cooldown."""
+
+    def __init__(self, retry_after: Optional[float] = None) -> None:
+        super().__init__(f"throttled (retry after {retry_after})")
+        self.retry_after = retry_after
+
+
+class GatewayStats:
+    __slots__ = ("latency", "error_rate", "cooldown_until", "samples", "requests")
+
+    def __init__(self) -> None:
+        self.latency = DEFAULT_LATENCY
+        self.error_rate = 0.0
+        self.cooldown_until = 0.0
+        self.samples: Deque[float] = deque(maxlen=50)
+        self.requests = 0
+
+    def p90(self) -> Optional[float]:
+        if len(self.samples) < MIN_SAMPLES_FOR_P90:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+
+
+class GatewayScheduler:
+    def __init__(self, gateways: List[str]) -> None:
+        self.gateways = list(gateways)
+        self.stats: Dict[str, GatewayStats] = {g: GatewayStats() for g in self.gateways}
+
+    def score(self, gateway: str) -> float:
+        s = self.stats[gateway]
+        return s.latency * (1.0 + ERROR_PENALTY * s.error_rate)
+
+    def ranked(self) -> List[str]:
+        """Best first; gateways on cooldown go last (still usable if nothing else is left)."""
+        now = time.monotonic()
+        return sorted(self.gateways, key=lambda g: (self.stats[g].cooldown_until > now, self.score(g)))
+
+    def hedge_delay(self, gateway: str) -> float:
+        p90 = self.stats[gateway].p90()
+        return max(MIN_HEDGE_DELAY, p90 if p90 is not None else DEFAULT_HEDGE_DELAY)
+
+    def record_success(self, gateway: str, latency: float) -> None:
+        s = self.stats[gateway]
+        s.requests += 1
+        s.latency = (1 - EWMA_ALPHA) * s.latency + EWMA_ALPHA * latency
+        s.error_rate = (1 - EWMA_ALPHA) * s.error_rate
+        s.samples.append(latency)
+
+    def record_error(self, gateway: str, latency: Optional[float] = None) -> None:
+        s = self.stats[gateway]
+        s.requests += 1
+        s.error_rate = (1 - EWMA_ALPHA) * s.error_rate + EWMA_ALPHA
+        if latency is not None:
+            s.latency = (1 - EWMA_ALPHA) * s.latency + EWMA_ALPHA * latency
+
+    def record_slow(self, gateway: str, elapsed: float) -> None:
+        """A hedged loser was cancelled after `elapsed`: a lower bound on its latency."""
+        s = self.stats[gateway]
+        if elapsed > s.latency:
+            s.latency = (1 - EWMA_ALPHA) * s.latency + EWMA_ALPHA * elapsed
+        s.samples.append(elapsed)
+
+    def record_throttle(self, gateway: str, retry_after: Optional[float] = None) -> None:
+        self.record_error(gateway)
+        self.stats[gateway].cooldown_until = time.monotonic() + (retry_after or DEFAULT_COOLDOWN)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            g: {
+                "latency_ms": round(s.latency * 1000),
+                "p90_ms": round((s.p90() or 0) * 1000),
+                "error_rate": round(s.error_rate, 3),
+                "cooling": s.cooldown_until > now,
+                "requests": s.requests,
+            }
+            for g, s in self.stats.items()
+        }
+
+    async def fetch(self, fetch_one: Callable[[str], Awaitable[Any]], max_parallel: int = 2) -> Any:
+        """First non-None result of `fetch_one(gateway)` over the ranked gateways, hedged.
+
+        `fetch_one` returns the result, None for "not here" (e.g. 404 / not JSON), or
+        raises (GatewayThrottled for 429s). Returns None if every gateway failed.
+        """
+        now = time.monotonic()
+        ranked = self.ranked()
+        # Skip gateways cooling down after a 429, unless that's all there is
+        pending = [g for g in ranked if self.stats[g].cooldown_until <= now] or ranked
+        running: Dict[asyncio.Task, tuple] = {}
+
+        def launch() -> None:
+            gateway = pending.pop(0)
+            task = asyncio.ensure_future(fetch_one(gateway))
+            running[task] = (gateway, time.monotonic())
+
+        try:
+            launch()
+            while running:
+                # Wait for the newest request's p90 before hedging onto the next gateway
+                newest_gateway, newest_started = list(running.values())[-1]
+                can_hedge = bool(pending) and len(running) < max_parallel
+                timeout = None
+                if can_hedge:
+                    timeout = max(0.0, newest_started + self.hedge_delay(newest_gateway) - time.monotonic())
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()  # hedge
+                    continue
+                for task in done:
+                    gateway, started = running.pop(task)
+                    elapsed = time.monotonic() - started
+                    exc = task.exception()
+                    if exc is None and task.result() is not None:
+                        self.record_success(gateway, elapsed)
+                        return task.result()
+                    if isinstance(exc, GatewayThrottled):
+                        self.record_throttle(gateway, exc.retry_after)
+                    else:
+                        self.record_error(gateway, elapsed if exc is None else None)
+                    if pending and len(running) < max_parallel:
+                        launch()
+            return None
+        finally:
+            # Cancel the losers (or everything, if we were cancelled ourselves)
+            now = time.monotonic()
+            for task, (gateway, started) in running.items():
+                if not task.done():
+                    task.cancel()
+                    self.record_slow(gateway, now - started)
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+
+__all__ = ["GatewayScheduler", "GatewayStats", "GatewayThrottled"]
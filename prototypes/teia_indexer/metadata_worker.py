@@ -3,18 +3,45 @@ import httpx
 import sqlite3
 import json
 import logging
+import multiprocessing
+import os
 import random
-import datetime
-from email.utils import parsedate_to_datetime
+import signal
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional, Dict, Any
 
+try:
+    import orjson
+    _HAS_ORJSON = True
+except Exception:
+    orjson = None
+    _HAS_ORJSON = False
+
+from ipfs_cache import default_cache
+from ipfs_gateways import GatewayScheduler, GatewayThrottled
+from tzkt_client import cassette_transport, parse_retry_after
+
 # --- CONFIG ---
 DB_FILE = "teia_index.db"
-BATCH_SIZE = 50       # How many items to fetch in parallel
-MAX_RETRIES = 3       # How many times to retry a specific token before marking FAILED
-CONCURRENCY = 10      # Simultaneous HTTP requests
+BATCH_SIZE = 50       # Jobs claimed per DB round trip
+MAX_RETRIES = 3       # Passes over the gateways within one fetch
+CONCURRENCY = 10      # Simultaneous HTTP requests (fetcher tasks)
+QUEUE_SIZE = 2 * CONCURRENCY  # Claimed jobs waiting for a fetcher
+WRITE_BATCH = 50      # Results per DB transaction...
+WRITE_INTERVAL = 2.0  # ...or flush after this many seconds
+IDLE_SLEEP = 30       # Poll interval when no jobs are due
+PARSE_WORKERS = min(4, os.cpu_count() or 1)  # Processes decoding/parsing metadata JSON
+PARSE_BATCH = 50      # Max bodies per hand-off to a parser process
 
-# Public IPFS Gateways (We rotate these to avoid rate limits)
+# Job queue (metadata_jobs): failed fetches are retried with exponential backoff
+MAX_ATTEMPTS = 6             # Fetches per token before it is marked FAILED
+RETRY_BASE_SECONDS = 60      # 1m, 2m, 4m, ... between attempts
+RETRY_MAX_SECONDS = 6 * 3600
+CLAIM_TIMEOUT_SECONDS = 600  # Claims older than this (crashed worker) go back to pending
+
+# Public IPFS Gateways (ranked by observed latency/errors, see ipfs_gateways.py)
 GATEWAYS = [
     "https://ipfs.io/ipfs/",
     "https://cloudflare-ipfs.com/ipfs/",
@@ -29,220 +56,378 @@ logging.basicConfig(
 )
 logger = logging.getLogger("worker")
 
+# Local CID -> body store, checked before any gateway (IPFS_CACHE_DIR, "" disables)
+CID_CACHE = default_cache()
+GATEWAY_SCHEDULER = GatewayScheduler(GATEWAYS)
+
 def get_db():
     return sqlite3.connect(DB_FILE, timeout=30.0)
 
-async def fetch_ipfs_json(client: httpx.AsyncClient, uri: str) -> Optional[Dict[str, Any]]:
-    """Fetch JSON metadata for an IPFS CID using multiple gateways.
+def init_jobs(conn: sqlite3.Connection):
+    """
+    Creates the metadata job queue. Triggers on `tokens` enqueue new 'Unknown' tokens
+    (snapshot, follow mode, re-queued URIs), so the queue never needs a tokens scan.
+    The first run seeds it from existing 'Unknown' and 'FAILED' tokens.
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='metadata_jobs'").fetchone()
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS metadata_jobs (
+            token_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'pending',  -- 'pending', 'claimed', 'failed'
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER NOT NULL DEFAULT 0,
+            claimed_by TEXT,
+            claimed_at INTEGER,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_metadata_jobs_due
+            ON metadata_jobs (next_attempt_at) WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS idx_metadata_jobs_claimed
+            ON metadata_jobs (claimed_at) WHERE status = 'claimed';
+
+        CREATE TRIGGER IF NOT EXISTS tokens_enqueue_insert AFTER INSERT ON tokens
+        WHEN NEW.title = 'Unknown'
+        BEGIN
+            INSERT INTO metadata_jobs (token_id) VALUES (NEW.id)
+            ON CONFLICT (token_id) DO UPDATE SET status = 'pending', attempts = 0, next_attempt_at = 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS tokens_enqueue_update AFTER UPDATE OF title ON tokens
+        WHEN NEW.title = 'Unknown' AND OLD.title IS NOT 'Unknown'
+        BEGIN
+            INSERT INTO metadata_jobs (token_id) VALUES (NEW.id)
+            ON CONFLICT (token_id) DO UPDATE SET status = 'pending', attempts = 0, next_attempt_at = 0;
+        END;
+    """)
+    if not exists:
+        conn.execute("""
+            INSERT OR IGNORE INTO metadata_jobs (token_id)
+            SELECT id FROM tokens WHERE title IN ('Unknown', 'FAILED')
+        """)
+        logger.info("📋 Seeded metadata_jobs with %d tokens", conn.execute("SELECT count(*) FROM metadata_jobs").fetchone()[0])
+    conn.commit()
+
+def claim_jobs(conn: sqlite3.Connection, worker_id: str, limit: int):
+    """Atomically claim up to `limit` due jobs -> [(token_id, metadata_uri), ...].
+    A single UPDATE ... RETURNING, so concurrent workers never get the same token."""
+    now = int(time.time())
+    with conn:
+        # Release claims of workers that died mid-batch
+        conn.execute(
+            "UPDATE metadata_jobs SET status = 'pending' WHERE status = 'claimed' AND claimed_at < ?",
+            (now - CLAIM_TIMEOUT_SECONDS,),
+        )
+        ids = [r[0] for r in conn.execute("""
+            UPDATE metadata_jobs
+            SET status = 'claimed', claimed_by = ?, claimed_at = ?, attempts = attempts + 1
+            WHERE token_id IN (
+                SELECT token_id FROM metadata_jobs
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            )
+            RETURNING token_id
+        """, (worker_id, now, now, limit)).fetchall()]
+    if not ids:
+        return []
+    rows = conn.execute(
+        "SELECT id, metadata_uri FROM tokens WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(ids),),
+    ).fetchall()
+    if len(rows) < len(ids):
+        # token rows gone (e.g. DB rebuilt): drop their jobs
+        with conn:
+            conn.execute("""
+                DELETE FROM metadata_jobs WHERE token_id IN (SELECT value FROM json_each(?))
+                AND token_id NOT IN (SELECT id FROM tokens)
+            """, (json.dumps(ids),))
+    return rows
+
+def retry_delay(attempts: int) -> int:
+    """Exponential backoff with jitter for the next attempt after `attempts` failures."""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return int(delay * random.uniform(0.8, 1.2))
+
+async def fetch_from_gateway(client: httpx.AsyncClient, gateway: str, cid: str) -> Optional[bytes]:
+    """One request to one gateway: the raw JSON body (parsed later, in the parser pool),
+    None if it doesn't have a JSON object, GatewayThrottled on 429, other exceptions for
+    transient failures."""
+    r = await client.get(f"{gateway}{cid}", timeout=10.0, follow_redirects=True, headers={"Accept": "application/json"})
+
+    # Successful JSON
+    if r.status_code == 200:
+        # If the gateway returned redirects before the final response, log that (helpful for debugging)
+        if getattr(r, "history", None):
+            logger.debug("%s redirected %d time(s) when fetching %s", gateway, len(r.history), cid)
+        if not r.content.lstrip().startswith(b"{"):
+            # Gateway sometimes returns HTML-based error pages with 200
+            logger.debug("%s returned non-JSON 200 for %s", gateway, cid)
+            return None
+        return r.content
+
+    # Rate limited: cool this gateway down (Retry-After seconds or HTTP-date)
+    if r.status_code == 429:
+        retry_after = parse_retry_after(r.headers.get("Retry-After"))
+        logger.debug("%s -> 429 for %s, cooling down %.0fs", gateway, cid, retry_after or 0)
+        raise GatewayThrottled(retry_after)
+
+    if r.status_code >= 500:
+        raise httpx.HTTPStatusError(f"{r.status_code} from {gateway}", request=r.request, response=r)
 
-    Improvements over the original:
-    - Honors `MAX_RETRIES` and uses exponential backoff + jitter
-    - Respects `Retry-After` header on 429 responses (both seconds and HTTP-date)
-    - Handles TooManyRedirects and logs redirect history when present
-    - Sets `Accept: application/json` to reduce HTML error pages
+    # 3xx/4xx: this gateway won't give us JSON for this CID
+    logger.debug("%s returned %d for %s; skipping gateway", gateway, r.status_code, cid)
+    return None
+
+async def fetch_ipfs_body(client: httpx.AsyncClient, uri: str) -> Optional[bytes]:
+    """Fetch the raw JSON metadata body for an IPFS CID.
+
+    - Local CID cache first (IPFS content is immutable)
+    - Gateways ranked by latency / error rate, skipping ones cooling down after a 429
+    - Hedged: if the best gateway is slower than its p90, the next one is raced against it
+    - Up to `MAX_RETRIES` passes over the gateways, with exponential backoff + jitter
     """
     if not uri or len(uri) < 5:
         return None
 
     cid = uri.replace("ipfs://", "").strip()
-    selected_gateways = random.sample(GATEWAYS, len(GATEWAYS))
-
-    for gateway in selected_gateways:
-        url = f"{gateway}{cid}"
-        attempt = 0
-        backoff = 1.0
-        last_was_429 = False
+    if CID_CACHE:
+        cached = CID_CACHE.get(cid)
+        if cached is not None:
+            return cached
 
-        while attempt < MAX_RETRIES:
-            try:
-                r = await client.get(url, timeout=10.0, follow_redirects=True, headers={"Accept": "application/json"})
-
-                # Successful JSON
-                if r.status_code == 200:
-                    # If the gateway returned redirects before the final response, log that (helpful for debugging)
-                    if getattr(r, "history", None):
-                        logger.debug("%s redirected %d time(s) when fetching %s", gateway, len(r.history), cid)
-
-                    try:
-                        return r.json()
-                    except json.JSONDecodeError:
-                        # Gateway sometimes returns HTML-based error pages with 200
-                        logger.debug("%s returned non-JSON 200 for %s", gateway, cid)
-                        return None
-
-                # Rate limited: respect Retry-After header when present and retry with backoff
-                if r.status_code == 429:
-                    last_was_429 = True
-                    ra = r.headers.get("Retry-After")
-                    sleep_for = None
-
-                    if ra:
-                        # Retry-After can be seconds or an HTTP-date
-                        try:
-                            sleep_for = int(ra)
-                        except ValueError:
-                            try:
-                                dt = parsedate_to_datetime(ra)
-                                # convert to UTC and compute seconds
-                                sleep_for = max(0, (dt - datetime.datetime.utcnow()).total_seconds())
-                            except Exception:
-                                sleep_for = None
-
-                    if sleep_for is None:
-                        sleep_for = backoff + random.random() * 0.5
-
-                    logger.warning("%s -> 429 for %s (attempt %d/%d). sleeping %.1fs", gateway, cid, attempt + 1, MAX_RETRIES, sleep_for)
-                    await asyncio.sleep(sleep_for)
-                    attempt += 1
-                    backoff *= 2
-                    continue
-
-                # Unexpected 3xx/4xx/5xx: don't hammer same gateway — try next gateway
-                if 300 <= r.status_code < 600:
-                    logger.debug("%s returned %d for %s; skipping gateway", gateway, r.status_code, cid)
-                    break
-
-            except httpx.TooManyRedirects:
-                logger.warning("Too many redirects from %s when fetching %s", gateway, cid)
-                break
-            except (httpx.ConnectError, httpx.TimeoutException) as e:
-                # transient network error -> retry same gateway with backoff
-                logger.debug("connect/timeout from %s for %s: %s (attempt %d/%d)", gateway, cid, e, attempt + 1, MAX_RETRIES)
-                attempt += 1
-                await asyncio.sleep(backoff + random.random() * 0.2)
-                backoff *= 2
-                continue
-            except Exception as e:
-                logger.exception("Unexpected error fetching %s from %s: %s", cid, gateway, e)
-                break
-
-        # If gateway returned repeated 429s, give a slightly longer cooldown before trying the next gateway
-        if last_was_429:
-            await asyncio.sleep(0.5)
+    backoff = 1.0
+    for attempt in range(MAX_RETRIES):
+        body = await GATEWAY_SCHEDULER.fetch(lambda gateway: fetch_from_gateway(client, gateway, cid))
+        if body is not None:
+            return body
+        if attempt + 1 < MAX_RETRIES:
+            await asyncio.sleep(backoff + random.random() * 0.5)
+            backoff *= 2
 
     return None
 
-async def process_batch(client: httpx.AsyncClient):
-    """
-    Selects a batch of 'Unknown' tokens and updates them.
-    """
-    conn = get_db()
-    c = conn.cursor()
+def parse_token_metadata(tid: int, data: Dict[str, Any]):
+    """Token metadata JSON -> (id, title, minter, artifact, royalties) row for write_results."""
+    # Title
+    title = data.get("name", "Untitled").replace("\x00", "") # Clean null bytes
     
-    # 1. Select candidates
-    # We look for tokens that are 'Unknown' AND haven't been marked 'FAILED'
-    c.execute("""
-        SELECT id, metadata_uri FROM tokens 
-        WHERE title = 'Unknown' 
-        LIMIT ?
-    """, (BATCH_SIZE,))
+    # Creator (Minter)
+    # Try 'creators' array first (Teia/HEN v2), then 'issuer' (HEN v1)
+    creators = data.get("creators", [])
+    minter = "Unknown"
+    if isinstance(creators, list) and len(creators) > 0:
+        minter = creators[0]
+    elif "issuer" in data:
+        minter = data.get("issuer")
     
-    rows = c.fetchall()
-    conn.close()
+    # Artifact (The image/video)
+    artifact = data.get("artifactUri", data.get("displayUri", ""))
     
-    if not rows:
-        return 0
-
-    updates = []
+    # Royalties (Often hidden in formats or top level)
+    # This is imprecise in JSON, but good enough for display
+    royalties = 0
+    if "royalties" in data:
+        try:
+            r = data["royalties"]
+            if isinstance(r, dict):
+                # standard TZIP format: { decimals: 3, shares: { addr: 100 } }
+                shares = r.get("shares", {})
+                if shares:
+                    royalties = sum(shares.values()) / (10 ** r.get("decimals", 0)) * 100
+        except: pass
     
-    async def process_single(row):
-        tid, uri = row
-        
+    return (tid, title[:100], minter, artifact, int(royalties))
+
+def parse_batch(items):
+    """Runs in the parser pool: [(id, uri, raw body or None)] -> write_results rows.
+    Decoding and field extraction (large generative-art metadata can take a while)
+    never block the event loop; valid bodies are stored in the CID cache from here."""
+    rows = []
+    for tid, uri, body in items:
         # If no URI exists, mark as invalid
         if not uri or uri == "Unknown":
-            return (tid, "MISSING_URI", "MISSING_URI", "MISSING_URI", 0)
-
-        data = await fetch_ipfs_json(client, uri)
-        
-        if data:
-            # --- PARSE METADATA ---
-            # Title
-            title = data.get("name", "Untitled").replace("\x00", "") # Clean null bytes
-            
-            # Creator (Minter)
-            # Try 'creators' array first (Teia/HEN v2), then 'issuer' (HEN v1)
-            creators = data.get("creators", [])
-            minter = "Unknown"
-            if isinstance(creators, list) and len(creators) > 0:
-                minter = creators[0]
-            elif "issuer" in data:
-                minter = data.get("issuer")
-            
-            # Artifact (The image/video)
-            artifact = data.get("artifactUri", data.get("displayUri", ""))
-            
-            # Royalties (Often hidden in formats or top level)
-            # This is imprecise in JSON, but good enough for display
-            royalties = 0
-            if "royalties" in data:
-                try:
-                    r = data["royalties"]
-                    if isinstance(r, dict):
-                        # standard TZIP format: { decimals: 3, shares: { addr: 100 } }
-                        shares = r.get("shares", {})
-                        if shares:
-                            royalties = sum(shares.values()) / (10 ** r.get("decimals", 0)) * 100
-                except: pass
-            
-            return (tid, title[:100], minter, artifact, int(royalties))
-        else:
-            # Could not fetch after all attempts
-            return (tid, "FAILED", "FAILED", "FAILED", 0)
-
-    # 2. Run fetches in parallel
-    tasks = [process_single(row) for row in rows]
-    results = await asyncio.gather(*tasks)
-    
-    # 3. Write to DB
-    conn = get_db()
+            rows.append((tid, "MISSING_URI", "MISSING_URI", "MISSING_URI", 0))
+            continue
+        try:
+            data = (orjson.loads(body) if _HAS_ORJSON else json.loads(body)) if body is not None else None
+            row = parse_token_metadata(tid, data) if data and isinstance(data, dict) else None
+        except (ValueError, TypeError, AttributeError):
+            row = None
+        if row is None:
+            # Could not fetch (or parse) after all attempts
+            rows.append((tid, "FAILED", "FAILED", "FAILED", 0))
+            continue
+        if CID_CACHE:
+            CID_CACHE.put(uri.replace("ipfs://", "").strip(), body)
+        rows.append(row)
+    return rows
+
+def init_parser():
+    # Ctrl+C is handled by the main process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+async def fetch_token_body(client: httpx.AsyncClient, row):
+    """Fetch one token's raw metadata -> (id, uri, body or None) for the parser pool."""
+    tid, uri = row
+    if not uri or uri == "Unknown":
+        return (tid, uri, None)
+    return (tid, uri, await fetch_ipfs_body(client, uri))
+
+def write_results(conn: sqlite3.Connection, results):
+    """Apply token updates and job outcomes for a batch of results in one transaction."""
     success_count = 0
-    
-    # Filter out None results
-    valid_results = [r for r in results if r is not None]
-    
-    for res in valid_results:
-        tid, title, minter, artifact, royalties = res
-        if title != "FAILED":
-            # Success: Update real data
-            conn.execute("""
-                UPDATE tokens 
-                SET title = ?, minter = ?, artifact_uri = ?, royalties = ? 
-                WHERE id = ?
-            """, (title, minter, artifact, royalties, tid))
-            success_count += 1
-        else:
-            # Failure: Mark as FAILED so we don't retry immediately
-            # (You can manually reset these to 'Unknown' later if you want to retry)
-            conn.execute("UPDATE tokens SET title = 'FAILED' WHERE id = ?", (tid,))
-            
-    conn.commit()
-    conn.close()
-    
-    return len(rows)
+    now = int(time.time())
+    with conn:
+        for res in results:
+            tid, title, minter, artifact, royalties = res
+            if title != "FAILED":
+                # Success: Update real data, job is finished
+                conn.execute("""
+                    UPDATE tokens 
+                    SET title = ?, minter = ?, artifact_uri = ?, royalties = ? 
+                    WHERE id = ?
+                """, (title, minter, artifact, royalties, tid))
+                conn.execute("DELETE FROM metadata_jobs WHERE token_id = ?", (tid,))
+                success_count += 1
+                continue
+
+            job = conn.execute("SELECT attempts FROM metadata_jobs WHERE token_id = ?", (tid,)).fetchone()
+            if job is None:
+                # Job already finished elsewhere (stale claim taken over, import_car.py): nothing to retry
+                continue
+            attempts = job[0]
+            if attempts < MAX_ATTEMPTS:
+                # Failure: schedule a retry with exponential backoff
+                conn.execute("""
+                    UPDATE metadata_jobs SET status = 'pending', next_attempt_at = ?, last_error = 'fetch failed'
+                    WHERE token_id = ?
+                """, (now + retry_delay(attempts), tid))
+            else:
+                # Out of attempts: mark FAILED (reset the job to 'pending' to try again later)
+                conn.execute("UPDATE metadata_jobs SET status = 'failed', last_error = 'fetch failed' WHERE token_id = ?", (tid,))
+                conn.execute("UPDATE tokens SET title = 'FAILED' WHERE id = ?", (tid,))
+    return success_count
+
+# --- PIPELINE ---
+# claimer -> jobs queue (bounded) -> CONCURRENCY fetchers -> fetched queue -> parser pool
+#   -> results queue -> batched writer
+# A slow CID only holds up its own fetcher; the others keep pulling jobs. The event loop
+# only moves bytes: JSON decoding and field extraction run in PARSE_WORKERS processes.
+
+async def claim_loop(conn: sqlite3.Connection, worker_id: str, jobs: asyncio.Queue, idle_sleep: float = IDLE_SLEEP):
+    idle = False
+    while True:
+        rows = claim_jobs(conn, worker_id, BATCH_SIZE)
+        if not rows:
+            if not idle:
+                print("\n💤 No metadata jobs due. Polling every %ds..." % idle_sleep)
+                idle = True
+            await asyncio.sleep(idle_sleep)
+            continue
+        idle = False
+        for row in rows:
+            # blocks while the fetchers are busy, so claims never pile up
+            await jobs.put(row)
+
+async def fetch_loop(client: httpx.AsyncClient, jobs: asyncio.Queue, fetched: asyncio.Queue):
+    while True:
+        row = await jobs.get()
+        try:
+            item = await fetch_token_body(client, row)
+        except Exception as e:
+            logger.exception("Unexpected error processing token %s: %s", row[0], e)
+            item = (row[0], row[1], None)
+        await fetched.put(item)
+
+async def parse_loop(pool: ProcessPoolExecutor, fetched: asyncio.Queue, results: asyncio.Queue):
+    """Hand fetched bodies to the parser pool in batches (one round trip per batch).
+    Batches are whatever has queued up while the parsers were busy, up to PARSE_BATCH."""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(PARSE_WORKERS)
 
-async def main():
-    print("🚀 Starting Metadata Worker...")
+    async def parse(batch):
+        try:
+            for res in await loop.run_in_executor(pool, parse_batch, batch):
+                await results.put(res)
+        finally:
+            slots.release()
+
+    async with asyncio.TaskGroup() as tg:
+        while True:
+            await slots.acquire()
+            batch = [await fetched.get()]
+            while len(batch) < PARSE_BATCH and not fetched.empty():
+                batch.append(fetched.get_nowait())
+            tg.create_task(parse(batch))
+
+async def write_loop(conn: sqlite3.Connection, results: asyncio.Queue, stats: Dict[str, int]):
+    loop = asyncio.get_running_loop()
+    pending = []
+    deadline = None
+
+    def flush():
+        nonlocal pending, deadline
+        stats["ok"] += write_results(conn, pending)
+        stats["processed"] += len(pending)
+        pending, deadline = [], None
+        print(f"✅ Processed {stats['processed']} tokens this session ({stats['ok']} updated)", end="\r")
+
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                pending.append(await asyncio.wait_for(results.get(), timeout))
+                if deadline is None:
+                    deadline = loop.time() + WRITE_INTERVAL
+            except TimeoutError:
+                pass
+            # Flush by size or by age of the oldest unwritten result
+            if pending and (len(pending) >= WRITE_BATCH or loop.time() >= deadline):
+                flush()
+    except asyncio.CancelledError:
+        # Shutting down: keep what was already fetched
+        if pending:
+            flush()
+        raise
+
+async def main(worker_id: str):
+    print(f"🚀 Starting Metadata Worker {worker_id}...")
     print("   (Press Ctrl+C to stop. Progress is saved automatically.)")
+
+    conn = get_db()
+    init_jobs(conn)
     
     # Initialize connection pool settings
     limits = httpx.Limits(max_keepalive_connections=CONCURRENCY, max_connections=CONCURRENCY)
     
-    async with httpx.AsyncClient(limits=limits, timeout=15.0) as client:
-        total_processed = 0
-        while True:
-            count = await process_batch(client)
-            
-            if count == 0:
-                print("💤 No more 'Unknown' tokens found. Sleeping 30s...")
-                await asyncio.sleep(30)
-            else:
-                total_processed += count
-                print(f"✅ Processed batch. Total this session: {total_processed}", end="\r")
-                # Tiny sleep to let the CPU breathe
-                await asyncio.sleep(0.5)
+    jobs = asyncio.Queue(maxsize=QUEUE_SIZE)
+    fetched = asyncio.Queue()
+    results = asyncio.Queue()
+    stats = {"processed": 0, "ok": 0}
+
+    # HTTP_CASSETTE / HTTP_CASSETTE_MODE switch the gateways to a record/replay archive
+    async with httpx.AsyncClient(limits=limits, timeout=15.0, transport=cassette_transport(limits)) as client:
+        try:
+            # Spawned, not forked: a fork would copy the running event loop, sockets and DB connection
+            with ProcessPoolExecutor(max_workers=PARSE_WORKERS, initializer=init_parser,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(claim_loop(conn, worker_id, jobs))
+                    for _ in range(CONCURRENCY):
+                        tg.create_task(fetch_loop(client, jobs, fetched))
+                    tg.create_task(parse_loop(pool, fetched, results))
+                    tg.create_task(write_loop(conn, results, stats))
+        finally:
+            conn.close()
+            for gateway, g in GATEWAY_SCHEDULER.snapshot().items():
+                logger.info("🌐 %s: %s", gateway, g)
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="IPFS metadata worker (several can run side by side)")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.worker_id))
     except KeyboardInterrupt:
         print("\n🛑 Worker stopped.")
\ No newline at end of file
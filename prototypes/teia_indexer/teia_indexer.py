@@ -1,10 +1,19 @@
 import asyncio
-import httpx
 import sqlite3
 import json
 import logging
+import time
 from typing import List, Dict
 
+try:
+    import orjson
+    _HAS_ORJSON = True
+except Exception:
+    orjson = None
+    _HAS_ORJSON = False
+
+from tzkt_client import TzktClient
+
 # --- CONFIGURATION ---
 DB_FILE = "teia_index.db"
 # Contracts
@@ -20,15 +29,46 @@ MARKET_ADDRESSES = list(MARKETS.values())
 BATCH_SIZE = 1000  # For BigMap fetching
 OPS_BATCH_SIZE = 500  # For Transaction fetching
 CONCURRENCY = 1  # Max parallel requests
-
-RATE_LIMIT_DELAY = 2.0 # Seconds to sleep between loops (Be nice to TzKT)
+FOLLOW_INTERVAL = 30  # Seconds between polls in --follow mode
+# Request pacing/retries live in TzktClient (adaptive token bucket)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Bulk ingest (--ingest): fewer fsyncs and index writes during the first backfill
+INGEST_COMMIT_PAGES = 20  # pages per transaction while ingesting
+INGEST_PRAGMAS = (
+    "PRAGMA synchronous = OFF",  # app crashes are safe; an OS crash may need a resync
+    "PRAGMA cache_size = -262144",  # 256MB
+    "PRAGMA temp_store = MEMORY",
+)
+READ_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",  # 64MB
+)
+# Secondary indexes (dropped while ingesting, rebuilt in one pass afterwards)
+SECONDARY_INDEXES = {
+    "idx_events_token": "CREATE INDEX IF NOT EXISTS idx_events_token ON events (token_id, op_id)",
+    "idx_events_buyer": "CREATE INDEX IF NOT EXISTS idx_events_buyer ON events (buyer)",
+    "idx_events_seller": "CREATE INDEX IF NOT EXISTS idx_events_seller ON events (seller)",
+    "idx_holders_address": "CREATE INDEX IF NOT EXISTS idx_holders_address ON holders (address)",
+}
+
+_ingesting = False
+_pending_pages = 0
+
+# Progress counters in `state` (read by index_monitor.py instead of count(*) scans)
+COUNTED_TABLES = ("tokens", "holders", "events")
+RATE_SMOOTHING = 0.3  # EWMA weight of the newest throughput sample
+_rate_samples = {}  # name -> (monotonic time of last sample, smoothed rate)
+
 # --- DATABASE SETUP ---
-def init_db():
+def init_db(ingest: bool = False):
     conn = sqlite3.connect(DB_FILE)
+    # WAL: readers (API, monitor, analysts) don't block the indexer and vice versa
+    conn.execute("PRAGMA journal_mode = WAL")
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
     c = conn.cursor()
     
     # 1. TOKENS (The Objects)
@@ -66,7 +106,15 @@ def init_db():
         PRIMARY KEY (op_id)
     )""")
 
-    # 4. STATE (Cursor)
+    # 4. SWAP TOKENS (swap_id -> token, prefetched from the markets' swaps bigmaps)
+    c.execute("""CREATE TABLE IF NOT EXISTS swap_tokens (
+        contract TEXT,
+        swap_id INTEGER,
+        token_id INTEGER,
+        PRIMARY KEY (contract, swap_id)
+    ) WITHOUT ROWID""")
+
+    # 5. STATE (Cursor)
     c.execute("""CREATE TABLE IF NOT EXISTS state (
         key TEXT PRIMARY KEY, 
         value INTEGER
@@ -85,8 +133,74 @@ def init_db():
         # best-effort; existing DBs will continue to work
         pass
 
+    # Reconcile the row counters once per run; batches keep them current afterwards
+    for table in COUNTED_TABLES:
+        count = conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (f"count_{table}", count))
+    conn.commit()
+
+    # Also rebuilds indexes left dropped by an interrupted --ingest run
+    if not ingest:
+        for sql in SECONDARY_INDEXES.values():
+            conn.execute(sql)
+        conn.commit()
+
     return conn
 
+def begin_ingest(conn: sqlite3.Connection):
+    """Switch to bulk-ingest settings: no secondary indexes, relaxed fsync, grouped commits."""
+    global _ingesting, _pending_pages
+    for pragma in INGEST_PRAGMAS:
+        conn.execute(pragma)
+    for name in SECONDARY_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    _ingesting, _pending_pages = True, 0
+    logger.info(f"🚚 Ingest mode: secondary indexes dropped, committing every {INGEST_COMMIT_PAGES} pages")
+
+def end_ingest(conn: sqlite3.Connection):
+    """Flush, rebuild indexes, then go back to the read-optimised configuration."""
+    global _ingesting
+    conn.commit()
+    _ingesting = False
+    logger.info("🔧 Rebuilding secondary indexes...")
+    for sql in SECONDARY_INDEXES.values():
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+    conn.commit()
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA optimize")
+    logger.info("✅ Ingest finished; database switched to read-optimised settings")
+
+def record_progress(conn: sqlite3.Connection, name: str, rows: int, counted: bool = True):
+    """Add `rows` to `count_<name>` and update the `rate_<name>` throughput sample (rows/sec).
+    Written in the caller's transaction, so counters move together with the data."""
+    if counted and rows:
+        conn.execute("UPDATE state SET value = value + ? WHERE key = ?", (rows, f"count_{name}"))
+    now = time.monotonic()
+    last, rate = _rate_samples.get(name, (None, 0.0))
+    if last is not None and now > last:
+        sample = abs(rows) / (now - last)
+        rate = sample if rate == 0.0 else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * rate
+    _rate_samples[name] = (now, rate)
+    conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", [
+        (f"rate_{name}", round(rate, 1)),
+        ("progress_ts", int(time.time())),
+    ])
+
+def commit_page(conn: sqlite3.Connection):
+    """Commit a page (rows + cursor). In ingest mode pages are grouped into larger
+    transactions; a crash rolls back whole pages together with their cursors."""
+    global _pending_pages
+    if _ingesting:
+        _pending_pages += 1
+        if _pending_pages < INGEST_COMMIT_PAGES:
+            return
+        _pending_pages = 0
+    conn.commit()
+
 # --- HELPERS ---
 def hex_to_utf8(hex_str: str) -> str:
     """Decodes Tezos hex strings (often used in metadata)."""
@@ -95,22 +209,8 @@ def hex_to_utf8(hex_str: str) -> str:
     except:
         return hex_str
 
-def get_bigmap_ptr(client, contract, name):
-    """Finds the active BigMap ID for a specific storage key."""
-    # We use a synchronous call logic here wrapped in async for simplicity in flow
-    return None # Placeholder, we do this dynamically below
-
-# --- PHASE 1: SNAPSHOT (BigMaps) - ROBUST & RESUMABLE ---
-async def sync_tokens_and_holders(client: httpx.AsyncClient, conn: sqlite3.Connection):
-    """
-    Downloads current state of Tokens/Holders.
-    Features:
-    1. Robust BigMap discovery (fixes StopIteration).
-    2. Checks DB for progress to resume if interrupted.
-    """
-    logger.info("🔍 Fetching BigMap Pointers...")
-    
-    # 1. Get BigMap IDs with Fallbacks
+async def get_bigmap_ptrs(client: TzktClient):
+    """Finds the active (token_metadata, ledger) BigMap IDs of the HEN minter."""
     r = await client.get(f"https://api.tzkt.io/v1/contracts/{HEN_MINTER}/bigmaps")
     bigmaps = r.json()
     
@@ -130,262 +230,553 @@ async def sync_tokens_and_holders(client: httpx.AsyncClient, conn: sqlite3.Conne
     
     if not metadata_ptr or not ledger_ptr:
         logger.error(f"❌ Could not find BigMaps! Found: {[b.get('path') for b in bigmaps]}")
+    return metadata_ptr, ledger_ptr
+
+# --- PHASE 1: SNAPSHOT (BigMaps) - ROBUST & RESUMABLE ---
+async def sync_tokens_and_holders(client: TzktClient, conn: sqlite3.Connection):
+    """
+    Downloads current state of Tokens/Holders.
+    Features:
+    1. Robust BigMap discovery (fixes StopIteration).
+    2. Checks DB for progress to resume if interrupted.
+    3. Keyset pagination (bigmap key id cursor); tokens and holders sync concurrently.
+    """
+    logger.info("🔍 Fetching BigMap Pointers...")
+    
+    # 1. Get BigMap IDs with Fallbacks
+    metadata_ptr, ledger_ptr = await get_bigmap_ptrs(client)
+    if not metadata_ptr or not ledger_ptr:
         return
 
     logger.info(f"   -> Metadata Ptr: {metadata_ptr}")
     logger.info(f"   -> Ledger Ptr: {ledger_ptr}")
 
-    # --- PART A: SYNC TOKENS ---
-    # Check saved progress
+    # Remember where the snapshot started: follow mode replays bigmap updates from here
+    if conn.execute("SELECT 1 FROM state WHERE key='bigmap_level'").fetchone() is None:
+        head = (await client.get("https://api.tzkt.io/v1/head")).json()
+        conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('bigmap_level', ?)", (head['level'],))
+        conn.commit()
+
+    # Tokens and holders are independent bigmaps: page both at once
+    await asyncio.gather(
+        sync_bigmap_keys(client, conn, metadata_ptr, 'token_last_key_id', "tokens", parse_token_keys,
+                         lambda conn, rows: upsert_tokens(conn, [(row[0], row[4]) for row in rows]),
+                         table="tokens"),
+        sync_bigmap_keys(client, conn, ledger_ptr, 'holder_last_key_id', "holdings", parse_holder_keys,
+                         upsert_holders, active_only=True, table="holders"),
+    )
+
+def parse_token_keys(data: List[Dict]) -> List[tuple]:
+    rows = []
+    for item in data:
+        try:
+            tid = item['key']
+            # Extract hex string from map (usually key "")
+            # Handle cases where value might be just the bytes or a dict
+            val = item['value']
+            raw_bytes = ""
+            
+            if isinstance(val, dict):
+                raw_bytes = val.get('token_info', {}).get('', '')
+            elif isinstance(val, str):
+                # Sometimes raw value is returned if not decodable
+                raw_bytes = val
+            
+            meta_uri = hex_to_utf8(raw_bytes)
+            rows.append((tid, "Unknown", "Unknown", "Unknown", meta_uri, 0, 0))
+        except Exception:
+            continue
+    return rows
+
+def parse_holder_keys(data: List[Dict]) -> List[tuple]:
+    rows = []
+    for item in data:
+        try:
+            tid = item['key']['nat']
+            owner = item['key']['address']
+            amount = int(item['value'])
+            if amount > 0:
+                rows.append((tid, owner, amount))
+        except: continue
+    return rows
+
+async def sync_bigmap_keys(client: TzktClient, conn: sqlite3.Connection, ptr: int, cursor_key: str,
+                           label: str, parse, upsert, active_only: bool = False, table: str = None):
+    """
+    Keyset-paginated bigmap snapshot: pages by bigmap key id (`id.gt`) instead of `offset`,
+    so every page costs the same on TzKT and the stored cursor survives keys being added.
+    `upsert(conn, rows)` writes a parsed page and returns how many rows were new.
+    """
     c = conn.cursor()
-    c.execute("SELECT value FROM state WHERE key='token_offset'")
+    c.execute("SELECT value FROM state WHERE key=?", (cursor_key,))
     row = c.fetchone()
-    token_offset = row[0] if row else 0
+    last_key_id = row[0] if row else 0
     
-    if token_offset > 0:
-        logger.info(f"🔄 Resuming Token Sync from offset {token_offset}")
+    if last_key_id > 0:
+        logger.info(f"🔄 Resuming {label} sync after key id {last_key_id}")
     else:
-        logger.info("📦 Starting Token Sync...")
+        logger.info(f"📦 Starting {label} sync...")
 
+    params = {"limit": BATCH_SIZE, "sort.asc": "id", "select": "id,key,value"}
+    if active_only:
+        params["active"] = "true"
+
+    if table:
+        # Target size for the monitor's progress / ETA
+        info = (await client.get(f"https://api.tzkt.io/v1/bigmaps/{ptr}")).json()
+        head = info.get('activeKeys' if active_only else 'totalKeys')
+        if head is not None:
+            conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (f"head_{table}", head))
+
+    synced = 0
     while True:
-        r = await client.get(f"https://api.tzkt.io/v1/bigmaps/{metadata_ptr}/keys", params={
-            "limit": BATCH_SIZE,
-            "offset": token_offset,
-            "select": "key,value" 
-        })
+        r = await client.get(f"https://api.tzkt.io/v1/bigmaps/{ptr}/keys", params={**params, "id.gt": last_key_id})
         data = r.json()
         if not data: break
-        
-        rows = []
-        for item in data:
-            try:
-                tid = item['key']
-                # Extract hex string from map (usually key "")
-                # Handle cases where value might be just the bytes or a dict
-                val = item['value']
-                raw_bytes = ""
-                
-                if isinstance(val, dict):
-                    raw_bytes = val.get('token_info', {}).get('', '')
-                elif isinstance(val, str):
-                    # Sometimes raw value is returned if not decodable
-                    raw_bytes = val
-                
-                meta_uri = hex_to_utf8(raw_bytes)
-                rows.append((tid, "Unknown", "Unknown", "Unknown", meta_uri, 0, 0))
-            except Exception:
-                continue
-        
+
+        rows = parse(data)
         if rows:
-            conn.executemany("INSERT OR REPLACE INTO tokens (id, minter, title, artifact_uri, metadata_uri, royalties, supply) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
-            
-            # SAVE PROGRESS
-            token_offset += len(data)
-            conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('token_offset', ?)", (token_offset,))
-            conn.commit()
+            inserted = upsert(conn, rows)
+            if table:
+                record_progress(conn, table, inserted)
+
+        # SAVE PROGRESS (same transaction as the rows)
+        last_key_id = data[-1]['id']
+        synced += len(data)
+        conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (cursor_key, last_key_id))
+        commit_page(conn)
             
-        print(f"   -> Synced {token_offset} tokens...", end="\r")
+        print(f"   -> Synced {synced} {label} (key id {last_key_id})...", end="\r")
         
         # Stop if we fetched fewer than batch size (end of list)
         if len(data) < BATCH_SIZE: break
-
-        # rate limit
-        await asyncio.sleep(RATE_LIMIT_DELAY)
             
-    print(f"\n✅ Tokens Synced.")
-
-    # --- PART B: SYNC HOLDERS ---
-    # Check saved progress
-    c.execute("SELECT value FROM state WHERE key='holder_offset'")
-    row = c.fetchone()
-    holder_offset = row[0] if row else 0
-
-    if holder_offset > 0:
-        logger.info(f"🔄 Resuming Holder Sync from offset {holder_offset}")
-    else:
-        logger.info("👥 Starting Holder Sync...")
+    print(f"\n✅ {label.capitalize()} Synced.")
+
+# --- PHASE 1b: FOLLOW (BigMap updates) ---
+# Upserts (snapshot and follow) are split into insert-if-new + update so rowcounts give exact new-row counts
+INSERT_HOLDER_SQL = "INSERT OR IGNORE INTO holders (token_id, address, amount) VALUES (?, ?, ?)"
+UPDATE_HOLDER_SQL = "UPDATE holders SET amount = ? WHERE token_id = ? AND address = ? AND amount != ?"
+DELETE_HOLDER_SQL = "DELETE FROM holders WHERE token_id = ? AND address = ?"
+# New tokens start as 'Unknown' for the metadata worker; a changed URI is re-queued
+INSERT_TOKEN_SQL = """
+    INSERT OR IGNORE INTO tokens (id, minter, title, artifact_uri, metadata_uri, royalties, supply)
+    VALUES (?, 'Unknown', 'Unknown', 'Unknown', ?, 0, 0)
+"""
+UPDATE_TOKEN_SQL = "UPDATE tokens SET metadata_uri = ?, title = 'Unknown' WHERE id = ? AND metadata_uri IS NOT ?"
+
+def upsert_holders(conn: sqlite3.Connection, rows: List[tuple]) -> int:
+    """(token_id, address, amount) rows -> number of new holders."""
+    inserted = conn.executemany(INSERT_HOLDER_SQL, rows).rowcount
+    conn.executemany(UPDATE_HOLDER_SQL, [(amount, tid, addr, amount) for tid, addr, amount in rows])
+    return inserted
+
+def upsert_tokens(conn: sqlite3.Connection, rows: List[tuple]) -> int:
+    """(token_id, metadata_uri) rows -> number of new tokens."""
+    inserted = conn.executemany(INSERT_TOKEN_SQL, rows).rowcount
+    conn.executemany(UPDATE_TOKEN_SQL, [(uri, tid, uri) for tid, uri in rows])
+    return inserted
+
+def fold_bigmap_updates(updates: List[Dict], metadata_ptr: int, ledger_ptr: int):
+    """Collapse a page of updates to the last state per key -> (holder upserts, holder deletes, token upserts)."""
+    ledger, tokens = {}, {}
+    for u in updates:
+        content = u.get('content') or {}
+        try:
+            if u['bigmap'] == ledger_ptr:
+                key = (int(content['key']['nat']), content['key']['address'])
+                amount = int(content['value']) if u['action'] != 'remove_key' else 0
+                ledger[key] = amount
+            elif u['bigmap'] == metadata_ptr and u['action'] != 'remove_key':
+                rows = parse_token_keys([content])
+                if rows:
+                    tokens[int(rows[0][0])] = rows[0][4]
+        except Exception as e:
+            logger.debug(f"Skipping bigmap update {u.get('id')}: {e}")
+    upserts = [(tid, addr, amount) for (tid, addr), amount in ledger.items() if amount > 0]
+    deletes = [key for key, amount in ledger.items() if amount <= 0]
+    return upserts, deletes, list(tokens.items())
+
+async def sync_bigmap_updates(client: TzktClient, conn: sqlite3.Connection, metadata_ptr: int, ledger_ptr: int):
+    """
+    Keeps tokens/holders current from the ledger + token_metadata BigMap update stream,
+    starting at the stored snapshot level (then the last applied update id).
+    Each page is applied as one batch of upserts/deletes together with its cursor.
+    """
+    state = dict(conn.execute("SELECT key, value FROM state WHERE key IN ('bigmap_level', 'bigmap_update_id')").fetchall())
+    if 'bigmap_level' not in state:
+        logger.warning("No snapshot level recorded; run the snapshot first.")
+        return
+    last_update_id = state.get('bigmap_update_id')
 
+    applied = 0
     while True:
-        r = await client.get(f"https://api.tzkt.io/v1/bigmaps/{ledger_ptr}/keys", params={
+        params = {
+            "bigmap.in": f"{ledger_ptr},{metadata_ptr}",
             "limit": BATCH_SIZE,
-            "offset": holder_offset,
-            "active": "true",
-            "select": "key,value" 
-        })
-        data = r.json()
-        if not data: break
-        
-        rows = []
-        for item in data:
-            try:
-                tid = item['key']['nat']
-                owner = item['key']['address']
-                amount = int(item['value'])
-                if amount > 0:
-                    rows.append((tid, owner, amount))
-            except: continue
-            
-        if rows:
-            conn.executemany("INSERT OR REPLACE INTO holders (token_id, address, amount) VALUES (?, ?, ?)", rows)
-            
-            # SAVE PROGRESS
-            holder_offset += len(data)
-            conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('holder_offset', ?)", (holder_offset,))
-            conn.commit()
-            
-        print(f"   -> Synced {holder_offset} holdings...", end="\r")
-        
-        if len(data) < BATCH_SIZE: break
-
-        # rate limit
-        await asyncio.sleep(RATE_LIMIT_DELAY)
-            
-    print(f"\n✅ Holdings Synced.")
+            "sort.asc": "id",
+        }
+        if last_update_id is None:
+            params["level.gt"] = state['bigmap_level']
+        else:
+            params["id.gt"] = last_update_id
+        r = await client.get("https://api.tzkt.io/v1/bigmaps/updates", params=params)
+        updates = r.json()
+        if not updates: break
+
+        upserts, deletes, tokens = fold_bigmap_updates(updates, metadata_ptr, ledger_ptr)
+        holders_delta = tokens_delta = 0
+        if upserts:
+            holders_delta += upsert_holders(conn, upserts)
+        if deletes:
+            holders_delta -= conn.executemany(DELETE_HOLDER_SQL, deletes).rowcount
+        if tokens:
+            tokens_delta += upsert_tokens(conn, tokens)
+        record_progress(conn, "holders", holders_delta)
+        record_progress(conn, "tokens", tokens_delta)
+
+        last_update_id = updates[-1]['id']
+        conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('bigmap_update_id', ?)", (last_update_id,))
+        conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('bigmap_level', ?)", (updates[-1]['level'],))
+        commit_page(conn)
+        applied += len(updates)
+        print(f"   -> Applied {applied} bigmap updates (level {updates[-1]['level']})...", end="\r")
+
+        if len(updates) < BATCH_SIZE: break
+
+    if applied:
+        print(f"\n✅ Applied {applied} bigmap updates.")
 
 # --- PHASE 2: HISTORY (Transactions) ---
-async def sync_market_history(client: httpx.AsyncClient, conn: sqlite3.Connection):
+INSERT_EVENTS_SQL = """
+    INSERT OR IGNORE INTO events 
+    (op_hash, op_id, timestamp, type, contract, token_id, seller, buyer, amount, price_mutez, swap_id) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def set_state(conn: sqlite3.Connection, key: str, value: int):
+    conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+async def fetch_head_op_id(client: TzktClient):
+    """Id of the newest market operation (None if there is none)."""
+    r = await client.get("https://api.tzkt.io/v1/operations/transactions", params={
+        "target.in": ",".join(MARKET_ADDRESSES),
+        "entrypoint.in": "collect,swap,cancel_swap",
+        "status": "applied",
+        "limit": 1,
+        "sort.desc": "id",
+        "select": "id"
+    })
+    head = r.json()
+    return head[0] if head else None
+
+# Only the fields parse_market_ops reads, as positional arrays (no storage/metadata/per-row keys)
+MARKET_OP_FIELDS = "id,hash,timestamp,amount,sender,target,parameter,diffs"
+
+def decode_json(content: bytes):
+    return orjson.loads(content) if _HAS_ORJSON else json.loads(content)
+
+async def fetch_market_ops(client: TzktClient, after_id: int, up_to: int = None) -> List[list]:
+    """One page of market operations with id > after_id (and <= up_to when bounded),
+    as `[id, hash, timestamp, amount, sender, target, parameter, diffs]` rows."""
+    params = {
+        "target.in": ",".join(MARKET_ADDRESSES),
+        "entrypoint.in": "collect,swap,cancel_swap",
+        "status": "applied",
+        "limit": OPS_BATCH_SIZE,
+        "sort.asc": "id",
+        "id.gt": after_id,
+        "select.values": MARKET_OP_FIELDS
+    }
+    if up_to is not None:
+        params["id.le"] = up_to
+    r = await client.get("https://api.tzkt.io/v1/operations/transactions", params=params)
+    return decode_json(r.content)
+
+# --- SWAP INDEX (swap_id -> objkt_id per market) ---
+def parse_swap_keys(data: List[Dict], version: str = "V1") -> List[tuple]:
+    rows = []
+    for item in data:
+        try:
+            rows.append((version, int(item['key']), int(item['value']['objkt_id'])))
+        except Exception:
+            continue
+    return rows
+
+async def prefetch_swaps(client: TzktClient, conn: sqlite3.Connection, version: str):
+    """One-off bulk copy of a market's `swaps` bigmap (all keys, incl. removed) into `swap_tokens`.
+    Resumable and incremental via its key id cursor, like the snapshot."""
+    r = await client.get(f"https://api.tzkt.io/v1/contracts/{MARKETS[version]}/bigmaps")
+    ptr = next((b['ptr'] for b in r.json() if b.get('path') == 'swaps'), None)
+    if ptr is None:
+        logger.warning(f"{version} market has no 'swaps' bigmap; its collects resolve from indexed LIST events only.")
+        return
+    # A swap never changes token, so re-fetched keys can simply be ignored
+    await sync_bigmap_keys(client, conn, ptr, f'{version.lower()}_swap_key_id', f"{version} swaps",
+                           lambda data: parse_swap_keys(data, version),
+                           lambda conn, rows: conn.executemany(
+                               "INSERT OR IGNORE INTO swap_tokens (contract, swap_id, token_id) VALUES (?, ?, ?)", rows
+                           ).rowcount)
+
+def load_swap_index(conn: sqlite3.Connection) -> Dict[str, Dict[int, int]]:
+    """`{market version: {swap_id: objkt_id}}` from prefetched swaps and indexed LIST events."""
+    index: Dict[str, Dict[int, int]] = {}
+    for version, swap_id, token_id in conn.execute("SELECT contract, swap_id, token_id FROM swap_tokens"):
+        index.setdefault(version, {})[swap_id] = token_id
+    # ascending op_id: the latest LIST for a swap_id wins
+    for version, swap_id, token_id in conn.execute(
+        "SELECT contract, swap_id, token_id FROM events WHERE type='LIST' AND swap_id IS NOT NULL ORDER BY op_id"
+    ):
+        index.setdefault(version, {})[swap_id] = token_id
+    logger.info(f"🗂️  Swap index: {sum(len(v) for v in index.values())} swaps")
+    return index
+
+async def build_swap_index(client: TzktClient, conn: sqlite3.Connection) -> Dict[str, Dict[int, int]]:
+    # Every market's swaps up front: a collect never has to wait for its LIST to be indexed
+    await asyncio.gather(*(prefetch_swaps(client, conn, version) for version in MARKETS))
+    return load_swap_index(conn)
+
+def parse_market_ops(ops: List[list], swap_index: Dict[str, Dict[int, int]]) -> List[tuple]:
+    """Turn a page of market operation rows (see MARKET_OP_FIELDS) into `events` rows.
+    `swap_index` resolves collects (swap_id only) and is updated with every LIST."""
+    events = []
+    for op_id, op_hash, timestamp, op_amount, sender, target, parameter, diffs in ops:
+        try:
+            entry = parameter['entrypoint']
+            val = parameter['value']
+            contract_addr = target['address']
+
+            # Identify Market Version
+            version = "UNKNOWN"
+            for k, v in MARKETS.items():
+                if v == contract_addr: version = k
+            swaps = swap_index.setdefault(version, {})
+
+            # PARSE EVENT
+            if entry == "collect":
+                # V1: {objkt_amount, swap_id}; V2/Teia: the swap_id itself (one edition)
+                if isinstance(val, dict):
+                    swap_id, amount = val.get('swap_id'), int(val.get('objkt_amount', 1))
+                else:
+                    swap_id, amount = val, 1
+                swap_id = int(swap_id) if swap_id is not None else None
+
+                # The token is never in collect params: resolve via the in-memory swap index
+                objkt_id = swaps.get(swap_id) if swap_id is not None else None
+                if not objkt_id:
+                    logger.debug(f"could not resolve token for collect op {op_id} (swap_id={swap_id})")
+                    continue
+
+                # Seller = issuer of the swap (value of the market's swaps bigmap diff)
+                seller = "Unknown"
+                if diffs:
+                    content = diffs[0].get('content') or {}
+                    value = content.get('value')
+                    seller = value.get('issuer', seller) if isinstance(value, dict) else content.get('address', seller)
+                events.append((
+                    op_hash, op_id, timestamp,
+                    "SALE", version, objkt_id,
+                    seller,
+                    sender['address'],
+                    amount, op_amount, swap_id
+                ))
+
+            elif entry == "swap":
+                objkt_id = val.get('objkt_id') or val.get('objkt_amount')
+                price = val.get('xtz_per_objkt')
+                amount = val.get('objkt_amount') or val.get('amount')
+                swap_id = val.get('swap_id')
+
+                events.append((
+                    op_hash, op_id, timestamp,
+                    "LIST", version, objkt_id,
+                    sender['address'],
+                    None,
+                    amount, price, swap_id
+                ))
+
+                if swap_id is not None and objkt_id is not None:
+                    swaps[int(swap_id)] = int(objkt_id)
+
+        except Exception as e:
+            logger.warning(f"Parse error on {op_id}: {e}")
+            continue
+    return events
+
+async def sync_market_history(client: TzktClient, conn: sqlite3.Connection, swap_index: Dict = None):
     """
     Downloads historical 'collect' and 'swap' operations.
     """
     logger.info("📜 Syncing Market History...")
+    if swap_index is None:
+        swap_index = await build_swap_index(client, conn)
     
     # Get last synced ID
     c = conn.cursor()
     c.execute("SELECT value FROM state WHERE key='last_op_id'")
     row = c.fetchone()
     last_id = row[0] if row else 0
+
+    # Head of the market op stream, for the monitor's lag / ETA
+    head_id = await fetch_head_op_id(client)
+    if head_id is not None:
+        set_state(conn, 'head_op_id', head_id)
+        conn.commit()
     
     while True:
-        r = await client.get("https://api.tzkt.io/v1/operations/transactions", params={
-            "target.in": ",".join(MARKET_ADDRESSES),
-            "entrypoint.in": "collect,swap,cancel_swap",
-            "status": "applied",
-            "limit": OPS_BATCH_SIZE,
-            "sort.asc": "id",
-            "id.gt": last_id
-        })
-        ops = r.json()
+        ops = await fetch_market_ops(client, last_id)
         
         if not ops:
             logger.info("💤 History fully synced.")
             break
             
-        # lightweight swap_id cache to resolve V1 collects
-        swap_cache = {}
-        events = []
-        for op in ops:
-            try:
-                entry = op['parameter']['entrypoint']
-                val = op['parameter']['value']
-                contract_addr = op['target']['address']
-
-                # Identify Market Version
-                version = "UNKNOWN"
-                for k, v in MARKETS.items():
-                    if v == contract_addr: version = k
-
-                # PARSE EVENT
-                if entry == "collect":
-                    objkt_id = val.get('objkt_id', val.get('objkt_amount'))
-                    if not objkt_id and isinstance(val, int):
-                        objkt_id = val
-
-                    # V1 path: resolve via swap_id -> cache, DB, then TzKT
-                    swap_id = val.get('swap_id')
-                    if not objkt_id and swap_id is not None:
-                        objkt_id = swap_cache.get(swap_id)
-                        if not objkt_id:
-                            row = c.execute("SELECT token_id FROM events WHERE type='LIST' AND swap_id=? ORDER BY op_id DESC LIMIT 1", (swap_id,)).fetchone()
-                            if row:
-                                objkt_id = row[0]
-                            else:
-                                # fallback: look up recent swap ops near this collect
-                                try:
-                                    r_swap = await client.get("https://api.tzkt.io/v1/operations/transactions", params={
-                                        "target": contract_addr,
-                                        "entrypoint": "swap",
-                                        "status": "applied",
-                                        "limit": 50,
-                                        "sort.desc": "id",
-                                        "id.lt": op['id']
-                                    })
-                                    if r_swap.status_code == 200:
-                                        for sop in r_swap.json():
-                                            sval = sop.get('parameter', {}).get('value', {})
-                                            if sval and sval.get('swap_id') == swap_id:
-                                                objkt_id = sval.get('objkt_id') or sval.get('objkt_amount')
-                                                break
-                                except Exception as e:
-                                    logger.warning(f"swap lookup failed for swap_id={swap_id}: {e}")
-
-                    if not objkt_id:
-                        logger.debug(f"could not resolve token for collect op {op.get('id')} (swap_id={swap_id})")
-                        continue
-
-                    seller = op['diffs'][0]['content']['address'] if 'diffs' in op else "Unknown"
-                    events.append((
-                        op['hash'], op['id'], op['timestamp'],
-                        "SALE", version, objkt_id,
-                        seller,
-                        op['sender']['address'],
-                        1, op['amount'], swap_id
-                    ))
-
-                    if swap_id is not None:
-                        swap_cache[swap_id] = objkt_id
-
-                elif entry == "swap":
-                    objkt_id = val.get('objkt_id') or val.get('objkt_amount')
-                    price = val.get('xtz_per_objkt')
-                    amount = val.get('objkt_amount') or val.get('amount')
-                    swap_id = val.get('swap_id')
-
-                    events.append((
-                        op['hash'], op['id'], op['timestamp'],
-                        "LIST", version, objkt_id,
-                        op['sender']['address'],
-                        None,
-                        amount, price, swap_id
-                    ))
-
-                    if swap_id is not None:
-                        swap_cache[swap_id] = objkt_id
-
-            except Exception as e:
-                logger.warning(f"Parse error on {op.get('id')}: {e}")
-                continue
+        events = parse_market_ops(ops, swap_index)
 
+        # Using 'INSERT OR IGNORE' to prevent duplicates if restarting
         if events:
-            # Using 'INSERT OR IGNORE' to prevent duplicates if restarting
-            conn.executemany("""
-                INSERT OR IGNORE INTO events 
-                (op_hash, op_id, timestamp, type, contract, token_id, seller, buyer, amount, price_mutez, swap_id) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, events)
-            
-            # Update Cursor
-            last_id = ops[-1]['id']
-            conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('last_op_id', ?)", (last_id,))
-            conn.commit()
+            record_progress(conn, 'events', conn.executemany(INSERT_EVENTS_SQL, events).rowcount)
+        
+        # Update Cursor (also for pages with nothing to record, e.g. only cancel_swaps)
+        record_progress(conn, 'op_id', ops[-1][0] - last_id, counted=False)
+        last_id = ops[-1][0]
+        set_state(conn, 'last_op_id', last_id)
+        commit_page(conn)
             
         print(f"   -> Processed up to ID {last_id}...", end="\r")
-        await asyncio.sleep(RATE_LIMIT_DELAY) # Be nice to API
+
+# --- PHASE 2b: PARTITIONED BACKFILL ---
+# State keys: backfill_partitions = N, backfill_<i>_cursor / backfill_<i>_end per partition.
+# Partition i covers op ids (end[i-1], end[i]]; partition 0 starts at last_op_id.
+
+def load_backfill_plan(conn: sqlite3.Connection) -> List[List[int]]:
+    """Return `[[cursor, end], ...]` for an interrupted backfill, or [] if none is active."""
+    state = dict(conn.execute("SELECT key, value FROM state WHERE key LIKE 'backfill_%'").fetchall())
+    n = state.get('backfill_partitions')
+    if not n:
+        return []
+    return [[state[f'backfill_{i}_cursor'], state[f'backfill_{i}_end']] for i in range(n)]
+
+def backfill_frontier(plan: List[List[int]]) -> int:
+    """Highest op id below which every partition is complete (contiguous prefix)."""
+    frontier = plan[0][0]
+    for cursor, end in plan:
+        frontier = cursor
+        if cursor < end:
+            break
+    return frontier
+
+def commit_backfill_page(conn: sqlite3.Connection, plan: List[List[int]], i: int, events: List[tuple],
+                         advanced: int = 0):
+    """Write one partition page, its cursor and the merged main cursor in one transaction."""
+    if events:
+        record_progress(conn, 'events', conn.executemany(INSERT_EVENTS_SQL, events).rowcount)
+    record_progress(conn, 'op_id', advanced, counted=False)
+    set_state(conn, f'backfill_{i}_cursor', plan[i][0])
+    set_state(conn, 'last_op_id', backfill_frontier(plan))
+    commit_page(conn)
+
+async def backfill_partition(client: TzktClient, conn: sqlite3.Connection, plan: List[List[int]], i: int,
+                             swap_index: Dict[str, Dict[int, int]]):
+    while plan[i][0] < plan[i][1]:
+        ops = await fetch_market_ops(client, plan[i][0], up_to=plan[i][1])
+        events = parse_market_ops(ops, swap_index)
+        # a short page means the range is exhausted
+        previous = plan[i][0]
+        plan[i][0] = ops[-1][0] if len(ops) == OPS_BATCH_SIZE else plan[i][1]
+        commit_backfill_page(conn, plan, i, events, advanced=plan[i][0] - previous)
+
+        done = sum(1 for cursor, end in plan if cursor >= end)
+        print(f"   -> Backfill frontier {backfill_frontier(plan)} | partitions done {done}/{len(plan)}...", end="\r")
+
+async def backfill_market_history(client: TzktClient, conn: sqlite3.Connection, partitions: int,
+                                  swap_index: Dict = None):
+    """
+    First-sync mode: split (last_op_id, head] into N op-id ranges and sync them concurrently.
+    Every partition keeps its own cursor in `state`; `last_op_id` only advances over the
+    contiguous completed prefix, so the normal cursor stays valid if interrupted.
+    An interrupted backfill is resumed with its original ranges.
+    """
+    plan = load_backfill_plan(conn)
+    if plan:
+        logger.info(f"🔄 Resuming partitioned backfill ({len(plan)} partitions)")
+    else:
+        row = conn.execute("SELECT value FROM state WHERE key='last_op_id'").fetchone()
+        lo = row[0] if row else 0
+        head = await fetch_head_op_id(client)
+        hi = head if head is not None else lo
+        if hi - lo < partitions * OPS_BATCH_SIZE:
+            logger.info("Backfill range too small to partition; using sequential sync.")
+            return
+
+        step = (hi - lo) // partitions
+        ends = [lo + step * (i + 1) for i in range(partitions - 1)] + [hi]
+        starts = [lo] + ends[:-1]
+        plan = [[start, end] for start, end in zip(starts, ends)]
+        set_state(conn, 'backfill_partitions', partitions)
+        set_state(conn, 'head_op_id', hi)
+        for i, (cursor, end) in enumerate(plan):
+            set_state(conn, f'backfill_{i}_cursor', cursor)
+            set_state(conn, f'backfill_{i}_end', end)
+        conn.commit()
+        logger.info(f"🧩 Partitioned backfill of op ids ({lo}, {hi}] into {partitions} ranges")
+
+    # All partitions share the client's rate budget and the swap index. Partitions run concurrently,
+    # so a LIST in an earlier range may not be indexed yet: collects of every market resolve from
+    # the prefetched swaps bigmaps (complete before any partition starts).
+    if swap_index is None:
+        swap_index = await build_swap_index(client, conn)
+    await asyncio.gather(*[backfill_partition(client, conn, plan, i, swap_index) for i in range(len(plan))])
+
+    # Every range is complete: the main cursor takes over from here
+    set_state(conn, 'last_op_id', plan[-1][1])
+    conn.execute("DELETE FROM state WHERE key LIKE 'backfill_%'")
+    conn.commit()
+    print(f"\n✅ Partitioned backfill complete up to ID {plan[-1][1]}.")
 
 # --- MAIN LOOP ---
-async def main():
-    conn = init_db()
+async def main(partitions: int = 1, follow: bool = False, ingest: bool = False):
+    conn = init_db(ingest=ingest)
+    if ingest:
+        begin_ingest(conn)
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    # Shared rate-limited client: pacing and retries adapt to what TzKT allows
+    async with TzktClient(timeout=30.0) as client:
         # Step 1: Base State (Run this once, or periodically)
         print("--- PHASE 1: STATE SNAPSHOT ---")
         await sync_tokens_and_holders(client, conn)
         
         # Step 2: History (Runs until caught up)
         print("\n--- PHASE 2: HISTORY BACKFILL ---")
-        await sync_market_history(client, conn)
+        swap_index = await build_swap_index(client, conn)
+        if partitions > 1 or load_backfill_plan(conn):
+            await backfill_market_history(client, conn, partitions, swap_index)
+        await sync_market_history(client, conn, swap_index)
+
+        if ingest:
+            end_ingest(conn)
         
         print("\n✅ Indexer is up to date!")
+
+        # Step 3: Stay current from deltas only
+        if follow:
+            print("\n--- PHASE 3: FOLLOW ---")
+            metadata_ptr, ledger_ptr = await get_bigmap_ptrs(client)
+            while True:
+                await sync_bigmap_updates(client, conn, metadata_ptr, ledger_ptr)
+                await sync_market_history(client, conn, swap_index)
+                await asyncio.sleep(FOLLOW_INTERVAL)
+
         conn.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Teia/HEN indexer (snapshot + history)")
+    parser.add_argument("--partitions", type=int, default=1,
+                        help="Backfill history as N concurrent op-id ranges (first sync)")
+    parser.add_argument("--follow", action="store_true",
+                        help="After catching up, keep tokens/holders/events current from new updates")
+    parser.add_argument("--ingest", action="store_true",
+                        help="Bulk-ingest settings for a large first sync (indexes rebuilt at the end)")
+    args = parser.parse_args()
+    asyncio.run(main(partitions=args.partitions, follow=args.follow, ingest=args.ingest))
\ No newline at end of file
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import teia_indexer
+from teia_indexer import MARKETS, backfill_market_history, build_swap_index, init_db
+
+SWAPS_PTRS = {address: ptr for ptr, address in enumerate(MARKETS.values(), start=100)}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeTzkt:
+    """Serves the markets' swaps bigmaps and a fixed list of market ops."""
+
+    def __init__(self, ops, swaps):
+        self.ops = ops
+        self.swaps = swaps  # ptr -> [bigmap keys]
+
+    async def get(self, url, params=None):
+        params = params or {}
+        if "/v1/contracts/" in url:
+            address = url.split("/v1/contracts/")[1].split("/")[0]
+            return FakeResponse([{"path": "swaps", "ptr": SWAPS_PTRS[address]}])
+        if "/v1/bigmaps/" in url:
+            ptr = int(url.split("/v1/bigmaps/")[1].split("/")[0])
+            return FakeResponse([k for k in self.swaps.get(ptr, []) if k["id"] > params["id.gt"]])
+        if params.get("sort.desc"):
+            return FakeResponse([self.ops[-1][0]])
+        after, up_to = params["id.gt"], params.get("id.le")
+        page = [op for op in self.ops if op[0] > after and (up_to is None or op[0] <= up_to)]
+        if after < 10:
+            # the first range is slow: the later partition finishes before it
+            await asyncio.sleep(0.05)
+        return FakeResponse(page[:params["limit"]])
+
+
+def market_op(op_id, market, entrypoint, value):
+    return [op_id, f"oo{op_id}", "2023-01-01T00:00:00Z", 1_000_000, {"address": "tz1buyer"},
+            {"address": MARKETS[market]}, {"entrypoint": entrypoint, "value": value}, None]
+
+
+def test_collect_resolves_when_its_swap_is_listed_in_an_earlier_partition(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(teia_indexer, "OPS_BATCH_SIZE", 2)
+    # Teia swap params carry no swap_id: the token is only known from the swaps bigmap
+    ops = [
+        market_op(5, "TEIA", "swap", {"objkt_id": "77", "objkt_amount": "1", "xtz_per_objkt": "1000000"}),
+        market_op(15, "TEIA", "collect", "9"),
+        market_op(20, "V2", "collect", "3"),
+    ]
+    swaps = {
+        SWAPS_PTRS[MARKETS["TEIA"]]: [{"id": 1, "key": "9", "value": {"issuer": "tz1seller", "objkt_id": "77"}}],
+        SWAPS_PTRS[MARKETS["V2"]]: [{"id": 2, "key": "3", "value": {"issuer": "tz1other", "objkt_id": "42"}}],
+    }
+    client = FakeTzkt(ops, swaps)
+    conn = init_db()
+
+    async def run():
+        swap_index = await build_swap_index(client, conn)
+        await backfill_market_history(client, conn, 2, swap_index)
+
+    asyncio.run(run())
+    sales = conn.execute("SELECT op_id, contract, token_id, swap_id FROM events WHERE type='SALE' ORDER BY op_id")
+    assert sales.fetchall() == [(15, "TEIA", 77, 9), (20, "V2", 42, 3)]
+    assert conn.execute("SELECT value FROM state WHERE key='last_op_id'").fetchone() == (20,)
+    conn.close()
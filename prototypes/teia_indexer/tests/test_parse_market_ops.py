@@ -0,0 +1,40 @@
+from teia_indexer import MARKETS, parse_market_ops
+
+SENDER = {"address": "tz1buyer"}
+
+
+def market_op(op_id, market, entrypoint, value, diffs=None, amount=0):
+    # positional row, as requested with select.values=MARKET_OP_FIELDS
+    return [op_id, f"oo{op_id}", "2021-06-01T12:00:00Z", amount, SENDER,
+            {"address": MARKETS[market]}, {"entrypoint": entrypoint, "value": value}, diffs]
+
+
+def test_v1_collect_resolves_token_from_swap_index():
+    # real shape of a HEN V1 collect: nats as strings, token only in the swaps bigmap
+    diffs = [{"bigmap": 523, "path": "swaps", "action": "update_key", "content": {
+        "hash": "exprv...", "key": "123456",
+        "value": {"issuer": "tz1seller", "objkt_amount": "3", "objkt_id": "152", "xtz_per_objkt": "2000000"},
+    }}]
+    op = market_op(1, "V1", "collect", {"objkt_amount": "2", "swap_id": "123456"}, diffs, amount=4_000_000)
+
+    events = parse_market_ops([op], {"V1": {123456: 152}})
+
+    assert events == [("oo1", 1, "2021-06-01T12:00:00Z", "SALE", "V1", 152,
+                       "tz1seller", "tz1buyer", 2, 4_000_000, 123456)]
+
+
+def test_v1_collect_without_indexed_swap_is_skipped():
+    op = market_op(2, "V1", "collect", {"objkt_amount": "1", "swap_id": "999"})
+    assert parse_market_ops([op], {"V1": {}}) == []
+
+
+def test_scalar_collect_and_list_share_the_index():
+    swap_index = {}
+    listing = market_op(3, "TEIA", "swap", {"objkt_id": "7", "objkt_amount": "5", "xtz_per_objkt": "1000000", "swap_id": "42"})
+    collect = market_op(4, "TEIA", "collect", "42", amount=1_000_000)
+
+    events = parse_market_ops([listing, collect], swap_index)
+
+    assert [e[3] for e in events] == ["LIST", "SALE"]
+    assert events[1][5] == 7 and events[1][8] == 1
+    assert swap_index == {"TEIA": {42: 7}}
@@ -0,0 +1,368 @@
+"""Shared async TzKT client.
+
+One pooled `httpx.AsyncClient` behind an adaptive token bucket:
+- AIMD: the request rate creeps up while TzKT answers 200s and is halved on 429/5xx.
+- `Retry-After` (seconds or HTTP-date) pauses the whole bucket, not just one caller.
+- Transient failures are retried here, so callers don't need their own backoff loops.
+- Request rate / latency metrics are logged every `metrics_interval` seconds.
+- Record/replay cassette (`HTTP_CASSETTE=path.jsonl.gz`, `HTTP_CASSETTE_MODE=record|replay`)
+  for benchmarking indexers offline; replay latency via `HTTP_CASSETTE_LATENCY_MS`.
+
+The same file lives in `teia_indexer/` and `mvp1/teia-trust-mvp1/` (each prototype is
+a standalone uv project); keep the copies identical.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import datetime
+import gzip
+import json
+import logging
+import os
+import random
+import time
+from collections import defaultdict, deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+TZKT_API = "https://api.tzkt.io"
+
+# Public TzKT allows roughly 10 req/s per IP; start below that and let AIMD probe
+DEFAULT_RATE = 5.0
+MIN_RATE = 0.5
+MAX_RATE = 10.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+logger = logging.getLogger("tzkt")
+
+CASSETTE_ENV = "HTTP_CASSETTE"
+CASSETTE_MODE_ENV = "HTTP_CASSETTE_MODE"
+CASSETTE_LATENCY_ENV = "HTTP_CASSETTE_LATENCY_MS"
+# Only headers callers actually look at are kept; bodies are stored decoded
+CASSETTE_HEADERS = ("content-type", "retry-after")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """`Retry-After` as seconds; accepts delta-seconds or an HTTP-date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(value)
+        return max(0.0, (dt - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose refill rate follows AIMD (additive increase, multiplicative decrease)."""
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        min_rate: float = MIN_RATE,
+        max_rate: float = MAX_RATE,
+        burst: float = 2.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+    ) -> None:
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.capacity = burst
+        self.increase = increase  # ~req/s gained per second of clean responses
+        self.decrease = decrease
+        self.tokens = burst
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # The lock makes waiters queue up FIFO instead of all waking at once
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def on_success(self) -> None:
+        # +increase/rate per response ~= +increase req/s per second at full speed
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        now = time.monotonic()
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+            self.tokens = 0.0
+        # one burst of concurrent 429s should only cut the rate once
+        if now - self._last_decrease >= 1.0:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._last_decrease = now
+
+
+class TzktMetrics:
+    """Rolling request rate and latency figures."""
+
+    def __init__(self, window: float = 60.0) -> None:
+        self.window = window
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.retries = 0
+        self._samples: Deque[Tuple[float, float]] = deque()  # (finished_at, latency)
+
+    def record(self, latency: float) -> None:
+        now = time.monotonic()
+        self.requests += 1
+        self._samples.append((now, latency))
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(l for _, l in self._samples)
+        span = (self._samples[-1][0] - self._samples[0][0]) if len(self._samples) > 1 else 0.0
+
+        def pct(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            "requests": self.requests,
+            "rps": (len(self._samples) - 1) / span if span > 0 else 0.0,
+            "p50_ms": pct(0.50) * 1000,
+            "p95_ms": pct(0.95) * 1000,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "retries": self.retries,
+        }
+
+
+def cassette_key(request: httpx.Request) -> str:
+    """Method + URL with sorted query params, so param order doesn't matter."""
+    query = "&".join(sorted(str(request.url.query, "ascii").split("&"))) if request.url.query else ""
+    return f"{request.method} {request.url.host}{request.url.path}?{query}"
+
+
+class CassetteMiss(LookupError):
+    """Replayed a request that was never recorded (deliberately not retried)."""
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Pass requests through to `inner` and append each exchange to a gzip JSON-lines archive.
+
+    The file is opened in append mode (one gzip member per session), so several
+    recording runs can build up one cassette.
+    """
+
+    def __init__(self, path: str, inner: httpx.AsyncBaseTransport) -> None:
+        self.path = path
+        self.inner = inner
+        self.recorded = 0
+        self._fh = gzip.open(path, "at", encoding="utf-8")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.inner.handle_async_request(request)
+        try:
+            raw = await response.aread()
+        finally:
+            await response.aclose()
+        headers = {k: v for k, v in response.headers.items() if k.lower() in CASSETTE_HEADERS}
+        entry: Dict[str, Any] = {"key": cassette_key(request), "status": response.status_code, "headers": headers}
+        try:
+            entry["body"] = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(raw).decode("ascii")
+        self._fh.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.recorded += 1
+        return httpx.Response(response.status_code, headers=headers, content=raw, request=request)
+
+    async def aclose(self) -> None:
+        self._fh.close()
+        logger.info("Cassette: recorded %d responses to %s", self.recorded, self.path)
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serve recorded responses without touching the network.
+
+    Repeated requests for the same key get the recorded responses in order (the last
+    one repeats once they run out). `latency` (+ up to `jitter`, seeded) is slept per
+    request so throughput numbers aren't just CPU time.
+    """
+
+    def __init__(self, path: str, latency: float = 0.0, jitter: float = 0.0, seed: int = 0) -> None:
+        self.path = path
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._entries: Dict[str, List[Tuple[int, Dict[str, str], bytes]]] = defaultdict(list)
+        self._served: Dict[str, int] = defaultdict(int)
+        self.misses = 0
+        count = 0
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            try:
+                for line in fh:
+                    e = json.loads(line)
+                    body = e["body"].encode("utf-8") if "body" in e else base64.b64decode(e["body_b64"])
+                    self._entries[e["key"]].append((e["status"], e["headers"], body))
+                    count += 1
+            except (EOFError, json.JSONDecodeError):
+                # an interrupted recording leaves a truncated tail; keep what is complete
+                logger.warning("Cassette %s is truncated after %d responses", path, count)
+        logger.info("Cassette: replaying %d responses (%d distinct requests) from %s", count, len(self._entries), path)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = cassette_key(request)
+        recorded = self._entries.get(key)
+        if not recorded:
+            self.misses += 1
+            raise CassetteMiss(f"no recorded response for {key}")
+        i = self._served[key]
+        self._served[key] = i + 1
+        status, headers, body = recorded[min(i, len(recorded) - 1)]
+        delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        return httpx.Response(status, headers=headers, content=body, request=request)
+
+
+def cassette_transport(limits: Optional[httpx.Limits] = None) -> Optional[httpx.AsyncBaseTransport]:
+    """Transport selected by the `HTTP_CASSETTE*` env vars, or None for normal networking.
+
+    Works for any `httpx.AsyncClient` (e.g. the IPFS metadata worker), not only `TzktClient`.
+    """
+    path = os.environ.get(CASSETTE_ENV)
+    if not path:
+        return None
+    mode = os.environ.get(CASSETTE_MODE_ENV, "replay").lower()
+    if mode == "record":
+        inner = httpx.AsyncHTTPTransport(limits=limits or httpx.Limits())
+        return RecordingTransport(path, inner)
+    if mode == "replay":
+        latency = float(os.environ.get(CASSETTE_LATENCY_ENV, "0")) / 1000.0
+        return ReplayTransport(path, latency=latency, jitter=latency * 0.2)
+    raise ValueError(f"{CASSETTE_MODE_ENV} must be 'record' or 'replay', got '{mode}'")
+
+
+class TzktClient:
+    """Pooled, rate-limited TzKT client. Use as `async with TzktClient() as client:`.
+
+    `get()` mirrors `httpx.AsyncClient.get` (absolute URLs or paths relative to
+    `base_url`) and returns the final response after retries, so existing call sites
+    keep checking `status_code` / calling `.json()`.
+    """
+
+    def __init__(
+        self,
+        base_url: str = TZKT_API,
+        rate: float = DEFAULT_RATE,
+        max_rate: float = MAX_RATE,
+        max_connections: int = 10,
+        timeout: float = 30.0,
+        retries: int = 5,
+        metrics_interval: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.bucket = AdaptiveTokenBucket(rate=rate, max_rate=max_rate)
+        self.metrics = TzktMetrics()
+        self.retries = retries
+        self.metrics_interval = metrics_interval
+        self._last_report = time.monotonic()
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=limits,
+            transport=transport or cassette_transport(limits),
+        )
+
+    async def __aenter__(self) -> "TzktClient":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> httpx.Response:
+        backoff = 1.0
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            started = time.monotonic()
+            try:
+                r = await self._client.get(url, params=params, **kwargs)
+            except httpx.TransportError as e:
+                self.metrics.errors += 1
+                self.bucket.on_throttle()
+                if attempt == self.retries:
+                    raise
+                self.metrics.retries += 1
+                logger.debug("TzKT transport error on %s: %s (attempt %d)", url, e, attempt + 1)
+                await asyncio.sleep(backoff + random.random() * 0.5)
+                backoff *= 2
+                continue
+
+            self.metrics.record(time.monotonic() - started)
+            self._maybe_report()
+
+            if r.status_code in RETRY_STATUSES:
+                self.metrics.throttled += 1
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                self.bucket.on_throttle(retry_after)
+                if attempt == self.retries:
+                    return r
+                self.metrics.retries += 1
+                logger.debug("TzKT %d on %s (retry-after=%s, rate now %.2f/s)", r.status_code, url, retry_after, self.bucket.rate)
+                if retry_after is None:
+                    await asyncio.sleep(backoff + random.random() * 0.5)
+                    backoff *= 2
+                continue
+
+            self.bucket.on_success()
+            return r
+        raise RuntimeError("unreachable")
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        r = await self.get(url, params=params, **kwargs)
+        r.raise_for_status()
+        return r.json()
+
+    def _maybe_report(self) -> None:
+        now = time.monotonic()
+        if now - self._last_report < self.metrics_interval:
+            return
+        self._last_report = now
+        m = self.metrics.snapshot()
+        logger.info(
+            "TzKT: %.1f req/s (limit %.1f/s) | p50 %.0fms p95 %.0fms | %d reqs, %d throttled, %d errors",
+            m["rps"], self.bucket.rate, m["p50_ms"], m["p95_ms"], m["requests"], m["throttled"], m["errors"],
+        )
+
+
+__all__ = [
+    "AdaptiveTokenBucket",
+    "CassetteMiss",
+    "RecordingTransport",
+    "ReplayTransport",
+    "TzktClient",
+    "TzktMetrics",
+    "cassette_transport",
+    "parse_retry_after",
+]
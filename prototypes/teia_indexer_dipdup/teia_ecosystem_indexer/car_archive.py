@@ -0,0 +1,217 @@
+"""Minimal reader for IPFS CAR archives (CARv1 and CARv2), for offline metadata imports.
+
+- `iter_blocks(path, wanted)` walks a memory-mapped archive block by block; block data is
+  only copied for multihashes in `wanted`, so scanning a large archive is disk-bound.
+- `iter_files(paths, wanted)` yields the UnixFS file contents (dag-pb or raw leaves) of the
+  wanted CIDs, reassembling chunked files (an extra pass only if a chunk precedes its root).
+- Blocks are matched by multihash, so `ipfs://Qm...` (CIDv0) URIs also match CIDv1 blocks.
+
+Hashes are not verified: archives are trusted local pins/exports.
+Same reader as `teia_indexer/car_archive.py`; this copy serves the `import_car_metadata` hook.
+"""
+
+from __future__ import annotations
+
+import base64
+import mmap
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from collections.abc import Iterator
+
+DAG_PB = 0x70
+RAW = 0x55
+UNIXFS_FILE_TYPES = (0, 2)  # Raw, File
+CARV2_PRAGMA = bytes.fromhex('0aa16776657273696f6e02')
+B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+B58_INDEX = {c: i for i, c in enumerate(B58_ALPHABET)}
+
+
+class CarError(ValueError):
+    """Malformed archive or block."""
+
+
+def read_varint(buf, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(buf):
+            raise CarError('truncated varint')
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+def b58encode(data: bytes) -> str:
+    n = int.from_bytes(data, 'big')
+    out = []
+    while n:
+        n, r = divmod(n, 58)
+        out.append(B58_ALPHABET[r])
+    pad = len(data) - len(data.lstrip(b'\0'))
+    return '1' * pad + ''.join(reversed(out))
+
+
+def b58decode(text: str) -> bytes:
+    n = 0
+    for c in text:
+        n = n * 58 + B58_INDEX[c]
+    pad = len(text) - len(text.lstrip('1'))
+    return b'\0' * pad + n.to_bytes((n.bit_length() + 7) // 8, 'big')
+
+
+def parse_cid(buf, pos: int = 0) -> tuple[bytes, int, bytes, int]:
+    """Binary CID at `pos` -> (multihash, codec, cid bytes, end offset)."""
+    if buf[pos] == 0x12 and buf[pos + 1] == 0x20:
+        # CIDv0: a bare sha2-256 multihash, always dag-pb
+        end = pos + 34
+        mh = bytes(buf[pos:end])
+        return mh, DAG_PB, mh, end
+    version, p = read_varint(buf, pos)
+    if version != 1:
+        raise CarError(f'unsupported CID version {version}')
+    codec, p = read_varint(buf, p)
+    mh_start = p
+    _, p = read_varint(buf, p)  # hash function
+    length, p = read_varint(buf, p)
+    end = p + length
+    return bytes(buf[mh_start:end]), codec, bytes(buf[pos:end]), end
+
+
+def cid_to_str(cid: bytes) -> str:
+    """Binary CID -> `Qm...` (v0) or base32 `b...` (v1), as gateways and URIs spell them."""
+    if len(cid) == 34 and cid[0] == 0x12:
+        return b58encode(cid)
+    return 'b' + base64.b32encode(cid).decode().lower().rstrip('=')
+
+
+def uri_multihash(uri: str) -> bytes | None:
+    """`ipfs://<cid>` -> multihash, or None for paths inside directories / unknown encodings."""
+    cid = uri.strip().removeprefix('ipfs://').strip('/')
+    if not cid or '/' in cid:
+        return None
+    try:
+        if cid.startswith('Qm') and len(cid) == 46:
+            return b58decode(cid)
+        if cid.startswith('b'):
+            raw = base64.b32decode(cid[1:].upper() + '=' * (-(len(cid) - 1) % 8))
+        elif cid.startswith('z'):
+            raw = b58decode(cid[1:])
+        else:
+            return None
+        return parse_cid(raw)[0]
+    except (KeyError, ValueError, IndexError):
+        return None
+
+
+def iter_blocks(path: str, wanted: set[bytes] | None = None) -> Iterator[tuple[bytes, int, bytes, bytes | None]]:
+    """(multihash, codec, cid, data) per block; data is None unless wanted (or `wanted` is None)."""
+    with Path(path).open('rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        start, end = 0, len(buf)
+        if buf[:11] == CARV2_PRAGMA:
+            # CARv2: fixed header after the pragma points at the inner CARv1 payload
+            start = int.from_bytes(buf[27:35], 'little')
+            end = start + int.from_bytes(buf[35:43], 'little')
+        header_len, pos = read_varint(buf, start)
+        pos += header_len
+        while pos < end:
+            length, pos = read_varint(buf, pos)
+            if length == 0:
+                break  # zero padding after the last block
+            section_end = pos + length
+            if section_end > end:
+                raise CarError(f'{path}: truncated block at offset {pos}')
+            mh, codec, cid, data_pos = parse_cid(buf, pos)
+            data = bytes(buf[data_pos:section_end]) if wanted is None or mh in wanted else None
+            yield mh, codec, cid, data
+            pos = section_end
+
+
+def _pb_fields(buf: bytes) -> Iterator[tuple[int, object]]:
+    """(field number, value) pairs of a protobuf message (dag-pb / UnixFS only use varints and bytes)."""
+    pos = 0
+    while pos < len(buf):
+        key, pos = read_varint(buf, pos)
+        wire = key & 7
+        if wire == 0:
+            value, pos = read_varint(buf, pos)
+        elif wire == 2:
+            n, pos = read_varint(buf, pos)
+            value = buf[pos : pos + n]
+            pos += n
+        else:
+            raise CarError(f'unsupported protobuf wire type {wire}')
+        yield key >> 3, value
+
+
+def file_parts(codec: int, data: bytes) -> tuple[bytes | None, list[bytes]]:
+    """Block -> (inline file bytes, child multihashes); (None, []) if it isn't part of a file."""
+    if codec == RAW:
+        return data, []
+    if codec != DAG_PB:
+        return None, []
+    links, node_data = [], b''
+    for field, value in _pb_fields(data):
+        if field == 2:  # PBLink
+            links.extend(parse_cid(v)[0] for f, v in _pb_fields(value) if f == 1)
+        elif field == 1:
+            node_data = value
+    kind, content = None, b''
+    for field, value in _pb_fields(node_data):
+        if field == 1:
+            kind = value
+        elif field == 2:
+            content = value
+    if kind not in UNIXFS_FILE_TYPES:
+        return None, []
+    return content, links
+
+
+def _read_file(mh: bytes, blocks: dict[bytes, tuple[int, bytes]]) -> bytes:
+    content, children = file_parts(*blocks[mh])
+    if content is None:
+        raise CarError('non-file block inside a file')
+    return content + b''.join(_read_file(child, blocks) for child in children)
+
+
+def iter_files(paths: Iterable[str], wanted: set[bytes]) -> Iterator[tuple[bytes, str, bytes]]:
+    """(multihash, cid, file bytes) for each wanted CID found in the archives (first copy wins)."""
+    paths = list(paths)
+    lookup = set(wanted)
+    found: set[bytes] = set()
+    roots: dict[bytes, str] = {}  # chunked files waiting for their chunks
+    blocks: dict[bytes, tuple[int, bytes]] = {}  # roots + chunks collected so far
+    while True:
+        missing_before = len(lookup - blocks.keys() - found)
+        for path in paths:
+            for mh, codec, cid, data in iter_blocks(path, lookup):
+                if data is None or mh in found or mh in blocks:
+                    continue
+                try:
+                    content, children = file_parts(codec, data)
+                except (CarError, IndexError):
+                    continue
+                if mh in wanted and not children:
+                    found.add(mh)
+                    if content is not None:
+                        yield mh, cid_to_str(cid), content
+                    continue
+                if mh in wanted:
+                    roots[mh] = cid_to_str(cid)
+                blocks[mh] = (codec, data)
+                lookup.update(children)
+        for mh in list(roots):
+            try:
+                content = _read_file(mh, blocks)
+            except (KeyError, CarError):
+                continue
+            found.add(mh)
+            yield mh, roots.pop(mh), content
+        # Another pass only helps if chunks were discovered that haven't been seen yet
+        missing = len(lookup - blocks.keys() - found)
+        if not roots or missing == 0 or missing == missing_before:
+            return
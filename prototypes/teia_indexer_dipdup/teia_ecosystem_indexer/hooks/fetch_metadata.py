@@ -1,9 +1,12 @@
 import asyncio
+
 import aiohttp
 from dipdup.context import HookContext
 
+from teia_ecosystem_indexer import ipfs_cache
+from teia_ecosystem_indexer import ipfs_gateways
+from teia_ecosystem_indexer import metadata_parser
 from teia_ecosystem_indexer import models
-from teia_ecosystem_indexer import utils
 
 IPFS_GATEWAYS = [
     'https://cloudflare-ipfs.com/ipfs/',
@@ -11,33 +14,47 @@ IPFS_GATEWAYS = [
     'https://ipfs.io/ipfs/',
 ]
 
+# IPFS content is immutable: bodies seen once (in any deployment sharing the dir) skip the gateways
+CID_CACHE = ipfs_cache.default_cache()
+# Shared across hook runs, so latency/error scores and 429 cooldowns carry over
+GATEWAY_SCHEDULER = ipfs_gateways.GatewayScheduler(IPFS_GATEWAYS)
+
+
+async def fetch_from_gateway(session: aiohttp.ClientSession, gateway: str, cid: str) -> bytes | None:
+    """One gateway request: the raw JSON body, None if the gateway has no JSON object, raises on 429/errors."""
+    # Lower timeout to prevent watchdog triggers
+    async with session.get(f'{gateway}{cid}', timeout=aiohttp.ClientTimeout(total=3)) as response:
+        if response.status == 429:
+            raise ipfs_gateways.GatewayThrottled(ipfs_gateways.parse_retry_after(response.headers.get('Retry-After')))
+        if response.status >= 500:
+            response.raise_for_status()
+        if response.status != 200:
+            return None
+        body = await response.read()
+    # Gateways sometimes answer 200 with an HTML error page; full parsing happens in the parser pool
+    return body if body.lstrip().startswith(b'{') else None
+
 
-async def fetch_json_with_fallback(session: aiohttp.ClientSession, cid: str) -> dict | None:
-    """Fetch JSON from IPFS using multiple gateways as fallbacks."""
-    for gateway in IPFS_GATEWAYS:
-        url = f'{gateway}{cid}'
-        try:
-            # Lower timeout to prevent watchdog triggers
-            async with session.get(url, timeout=3) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if isinstance(data, dict):
-                        return utils.clean_null_bytes(data)
-        except Exception:
-            continue
-    return None
+async def fetch_body_with_fallback(session: aiohttp.ClientSession, cid: str) -> bytes | None:
+    """Fetch a raw JSON body from the local CID cache, then the gateways ranked by latency (hedged)."""
+    if CID_CACHE:
+        cached = CID_CACHE.get(cid)
+        if cached is not None:
+            return cached
+
+    return await GATEWAY_SCHEDULER.fetch(lambda gateway: fetch_from_gateway(session, gateway, cid))
 
 
 async def process_token_metadata(session: aiohttp.ClientSession, token: models.Token, ctx: HookContext):
     cid = token.metadata_uri.replace('ipfs://', '')
-    data = await fetch_json_with_fallback(session, cid)
-    return token, cid, data
+    body = await fetch_body_with_fallback(session, cid)
+    return token, cid, body
 
 
 async def process_holder_metadata(session: aiohttp.ClientSession, holder: models.Holder, ctx: HookContext):
     cid = holder.metadata_uri.replace('ipfs://', '')
-    data = await fetch_json_with_fallback(session, cid)
-    return holder, cid, data
+    body = await fetch_body_with_fallback(session, cid)
+    return holder, cid, body
 
 
 async def fetch_metadata(ctx: HookContext) -> None:
@@ -72,42 +89,32 @@ async def fetch_metadata(ctx: HookContext) -> None:
             return
 
         all_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        token_results = [r for r in all_results if isinstance(r, tuple) and isinstance(r[0], models.Token)]
-        holder_results = [r for r in all_results if isinstance(r, tuple) and isinstance(r[0], models.Holder)]
+        fetched = [r for r in all_results if isinstance(r, tuple)]
+
+        # Decode + normalise all bodies in the parser pool (one batched hand-off), off the event loop
+        parsed = iter(
+            await metadata_parser.parse_bodies(
+                [
+                    ('token' if isinstance(entity, models.Token) else 'holder', cid, body)
+                    for entity, cid, body in fetched
+                    if body is not None
+                ]
+            )
+        )
+        fetched = [(entity, cid, next(parsed) if body is not None else None) for entity, cid, body in fetched]
+
+        token_results = [r for r in fetched if isinstance(r[0], models.Token)]
+        holder_results = [r for r in fetched if isinstance(r[0], models.Holder)]
 
         # Phase 2: Sequential DB Write (The safe part)
         # We do this one-by-one to avoid asyncpg 'another operation in progress' errors
-        for token, cid, data in token_results:
-            if data:
-                mime = ''
-                formats = data.get('formats', [])
-                if formats and isinstance(formats, list) and len(formats) > 0 and 'mimeType' in formats[0]:
-                    mime = formats[0]['mimeType']
-
-                await models.TokenMetadata.update_or_create(
-                    token=token,
-                    defaults={
-                        'content': data,
-                        'name': data.get('name'),
-                        'description': data.get('description'),
-                        'mime': mime,
-                        'artifact_uri': data.get('artifactUri'),
-                        'display_uri': data.get('displayUri'),
-                        'thumbnail_uri': data.get('thumbnailUri'),
-                    },
-                )
-
-                raw_tags = data.get('tags', [])
-                if isinstance(raw_tags, list):
-                    for tag_name in raw_tags:
-                        if not isinstance(tag_name, str) or len(tag_name) > 255:
-                            continue
-                        tag_name = tag_name.lower().strip()
-                        if not tag_name:
-                            continue
-                        tag_obj, _ = await models.Tag.get_or_create(name=tag_name)
-                        await models.TokenTag.get_or_create(token=token, tag=tag_obj)
+        for token, cid, meta in token_results:
+            if meta:
+                await models.TokenMetadata.update_or_create(token=token, defaults=meta['fields'])
+
+                for tag_name in meta['tags']:
+                    tag_obj, _ = await models.Tag.get_or_create(name=tag_name)
+                    await models.TokenTag.get_or_create(token=token, tag=tag_obj)
             else:
                 ctx.logger.warning('Failed IPFS gateways for token %s (%s). Skipping.', token.token_id, cid)
                 await models.IgnoredCid.get_or_create(cid=cid, defaults={'reason': 'Gateway timeout'})
@@ -115,17 +122,9 @@ async def fetch_metadata(ctx: HookContext) -> None:
             token.metadata_synced = True
             await token.save()
 
-        for holder, cid, data in holder_results:
-            if data:
-                await models.HolderMetadata.update_or_create(
-                    holder=holder,
-                    defaults={
-                        'content': data,
-                        'bio': data.get('description'),
-                        'alias': data.get('name') or data.get('alias'),
-                        'logo': data.get('logo') or data.get('avatar'),
-                    },
-                )
+        for holder, cid, meta in holder_results:
+            if meta:
+                await models.HolderMetadata.update_or_create(holder=holder, defaults=meta['fields'])
             else:
                 ctx.logger.warning('Failed IPFS gateways for holder %s (%s). Skipping.', holder.address, cid)
                 await models.IgnoredCid.get_or_create(cid=cid, defaults={'reason': 'Gateway timeout'})
@@ -0,0 +1,122 @@
+import asyncio
+import itertools
+
+from dipdup.context import HookContext
+from tortoise.transactions import in_transaction
+
+from teia_ecosystem_indexer import car_archive
+from teia_ecosystem_indexer import metadata_parser
+from teia_ecosystem_indexer import models
+
+IMPORT_BATCH = 2000  # CIDs per transaction
+
+
+def read_batch(files, wanted: dict) -> list[tuple[str, list[int], list[int], bytes]]:
+    """Next IMPORT_BATCH archive files -> [(cid, token pks, holder pks, raw body)]. Runs in a thread."""
+    return [(*wanted.pop(mh), body) for mh, _, body in itertools.islice(files, IMPORT_BATCH)]
+
+
+async def parse_batch(batch: list) -> tuple[list, list, int]:
+    """Raw bodies -> ([(token pks, meta)], [(holder pks, meta)], invalid count), parsed in the pool."""
+    items = []
+    for cid, token_pks, holder_pks, body in batch:
+        if token_pks:
+            items.append(('token', cid, body))
+        if holder_pks:
+            items.append(('holder', cid, body))
+    parsed = iter(await metadata_parser.parse_bodies(items))
+    tokens, holders, bad = [], [], 0
+    for _, token_pks, holder_pks, _ in batch:
+        for pks, out in ((token_pks, tokens), (holder_pks, holders)):
+            if not pks:
+                continue
+            meta = next(parsed)
+            if meta is None:
+                bad += 1
+            else:
+                out.append((pks, meta))
+    return tokens, holders, bad
+
+
+async def write_batch(tokens: list, holders: list) -> tuple[int, int]:
+    """Upsert one batch of metadata (plus tags) and mark its tokens/holders synced."""
+    token_rows, holder_rows, token_tags = [], [], []
+    for token_pks, meta in tokens:
+        for pk in token_pks:
+            token_rows.append(models.TokenMetadata(token_id=pk, **meta['fields']))
+            token_tags.extend((pk, tag) for tag in meta['tags'])
+    for holder_pks, meta in holders:
+        holder_rows.extend(models.HolderMetadata(holder_id=pk, **meta['fields']) for pk in holder_pks)
+
+    async with in_transaction():
+        if token_rows:
+            await models.TokenMetadata.bulk_create(
+                token_rows,
+                on_conflict=['token_id'],
+                update_fields=[
+                    'content',
+                    'name',
+                    'description',
+                    'mime',
+                    'artifact_uri',
+                    'display_uri',
+                    'thumbnail_uri',
+                ],
+            )
+            await models.Token.filter(id__in=[r.token_id for r in token_rows]).update(metadata_synced=True)
+        if token_tags:
+            names = {tag for _, tag in token_tags}
+            await models.Tag.bulk_create([models.Tag(name=name) for name in names], ignore_conflicts=True)
+            tag_ids = dict(await models.Tag.filter(name__in=names).values_list('name', 'id'))
+            await models.TokenTag.bulk_create(
+                [models.TokenTag(token_id=pk, tag_id=tag_ids[tag]) for pk, tag in token_tags],
+                ignore_conflicts=True,
+            )
+        if holder_rows:
+            await models.HolderMetadata.bulk_create(
+                holder_rows,
+                on_conflict=['holder_id'],
+                update_fields=['content', 'bio', 'alias', 'logo'],
+            )
+            await models.Holder.filter(id__in=[r.holder_id for r in holder_rows]).update(metadata_synced=True)
+    return len(token_rows), len(holder_rows)
+
+
+async def import_car_metadata(ctx: HookContext, paths: str) -> None:
+    """Fill token_metadata/holder_metadata for unsynced tokens and holders from local CAR archives.
+
+    `paths` is a comma-separated list of CARv1/CARv2 files. CIDs that aren't in the archives stay
+    unsynced for the `fetch_metadata` job.
+    """
+    archives = [path.strip() for path in paths.split(',') if path.strip()]
+
+    # multihash -> (cid as written in the URI, token pks, holder pks)
+    wanted: dict[bytes, tuple[str, list[int], list[int]]] = {}
+    for model, slot in ((models.Token, 1), (models.Holder, 2)):
+        rows = await model.filter(metadata_synced=False, metadata_uri__startswith='ipfs://').values_list(
+            'id', 'metadata_uri'
+        )
+        for pk, uri in rows:
+            mh = car_archive.uri_multihash(uri)
+            if mh is not None:
+                wanted.setdefault(mh, (uri.removeprefix('ipfs://').strip('/'), [], []))[slot].append(pk)
+    ctx.logger.info('Looking for %d metadata CIDs in %d CAR archive(s)', len(wanted), len(archives))
+
+    # The archive scan is blocking (mmap reads) and runs in a thread; JSON parsing runs in the parser pool
+    files = car_archive.iter_files(archives, set(wanted))
+    tokens = holders = bad = 0
+    while batch := await asyncio.to_thread(read_batch, files, wanted):
+        parsed_tokens, parsed_holders, batch_bad = await parse_batch(batch)
+        bad += batch_bad
+        batch_tokens, batch_holders = await write_batch(parsed_tokens, parsed_holders)
+        tokens += batch_tokens
+        holders += batch_holders
+        ctx.logger.info('CAR import: %d token and %d holder metadata rows written', tokens, holders)
+
+    ctx.logger.info(
+        'CAR import done: %d tokens, %d holders; %d invalid JSON, %d CIDs not in the archives',
+        tokens,
+        holders,
+        bad,
+        len(wanted),
+    )
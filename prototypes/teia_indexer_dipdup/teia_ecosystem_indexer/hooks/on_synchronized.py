@@ -1,3 +1,5 @@
+import os
+
 from dipdup.context import HookContext
 
 
@@ -5,3 +7,8 @@ async def on_synchronized(
     ctx: HookContext,
 ) -> None:
     await ctx.execute_sql_script('on_synchronized')
+
+    # Full reindex with pinned metadata archives: fill metadata from disk instead of gateways
+    car_paths = os.environ.get('METADATA_CAR_PATHS')
+    if car_paths:
+        await ctx.fire_hook('import_car_metadata', wait=False, paths=car_paths)
@@ -0,0 +1,69 @@
+"""Content-addressed local cache of IPFS metadata bodies.
+
+IPFS content is immutable, so a body fetched once for a CID never needs a gateway again,
+including across reindexes:
+- Layout: `<root>/<xx>/<yy>/<cid>.json.gz` (gzip of the raw gateway body), sharded on the CID tail.
+- Writes go to a temp file + rename, so concurrent hooks never see partial entries and the
+  directory can be shared between deployments (volume mount / rsync).
+- `IPFS_CACHE_DIR` sets the root (default `ipfs_cache`); an empty value disables it.
+
+Same layout as `teia_indexer/ipfs_cache.py`, so both metadata paths can share one directory.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import tempfile
+from pathlib import Path
+
+CACHE_DIR_ENV = 'IPFS_CACHE_DIR'
+DEFAULT_CACHE_DIR = 'ipfs_cache'
+
+
+def normalize_cid(uri: str) -> str:
+    """`ipfs://<cid>[/path]` or `<cid>[/path]` -> cache key (path separators flattened)."""
+    key = uri.strip()
+    key = key.removeprefix('ipfs://')
+    return key.strip('/').replace('/', '%2F')
+
+
+class CidCache:
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, cid: str) -> Path:
+        key = normalize_cid(cid)
+        tail = key.split('%2F', 1)[0][-4:].rjust(4, '_')
+        return self.root / tail[-2:] / tail[:2] / f'{key}.json.gz'
+
+    def get(self, cid: str) -> bytes | None:
+        try:
+            with gzip.open(self.path(cid), 'rb') as fh:
+                body = fh.read()
+        except (FileNotFoundError, OSError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body
+
+    def put(self, cid: str, body: bytes) -> None:
+        path = self.path(cid)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as fh:
+                fh.write(body)
+            Path(tmp).replace(path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+def default_cache() -> CidCache | None:
+    root = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+    return CidCache(root) if root else None
@@ -0,0 +1,79 @@
+"""Metadata normalisation in a process pool.
+
+JSON decoding, `clean_null_bytes` (rebuilds every dict/list) and field/tag extraction are
+CPU-bound; generative pieces with big attribute arrays would otherwise stall the event loop
+and every fetch running on it. Hooks hand raw bodies over in batches and only do network
+and DB I/O themselves:
+- `await parse_bodies([(kind, cid, body), ...])` -> one result per item, in order:
+  `{'fields': <model columns>, 'tags': [...]}` or None if the body isn't a JSON object.
+- Valid bodies are written to the CID cache from the parser processes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from teia_ecosystem_indexer import ipfs_cache
+from teia_ecosystem_indexer import utils
+
+PARSER_WORKERS = min(4, os.cpu_count() or 1)
+MIN_CHUNK = 8  # bodies per pool round trip, at least
+
+CID_CACHE = ipfs_cache.default_cache()
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _init_worker() -> None:
+    # Ctrl+C / SIGINT is handled by the DipDup process, not the parsers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Shared pool, started on first use and reused across hook runs."""
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: a fork would copy DipDup's running event loop, sockets and DB pool
+        _pool = ProcessPoolExecutor(
+            max_workers=PARSER_WORKERS,
+            initializer=_init_worker,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _pool
+
+
+def parse_body(kind: str, cid: str, body: bytes) -> dict[str, Any] | None:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    if CID_CACHE:
+        CID_CACHE.put(cid, body)
+    data = utils.clean_null_bytes(data)
+    if kind == 'token':
+        return {'fields': utils.token_metadata_fields(data), 'tags': utils.token_tags(data)}
+    return {'fields': utils.holder_metadata_fields(data), 'tags': []}
+
+
+def parse_batch(items: list[tuple[str, str, bytes]]) -> list[dict[str, Any] | None]:
+    """Runs in a parser process: one result per (kind, cid, body)."""
+    return [parse_body(kind, cid, body) for kind, cid, body in items]
+
+
+async def parse_bodies(items: list[tuple[str, str, bytes]]) -> list[dict[str, Any] | None]:
+    """Parse a batch in the pool, split into one chunk per worker."""
+    if not items:
+        return []
+    loop = asyncio.get_running_loop()
+    size = max(MIN_CHUNK, -(-len(items) // PARSER_WORKERS))
+    chunks = [items[i : i + size] for i in range(0, len(items), size)]
+    parsed = await asyncio.gather(*(loop.run_in_executor(get_pool(), parse_batch, chunk) for chunk in chunks))
+    return [result for chunk in parsed for result in chunk]
@@ -0,0 +1,74 @@
+import hashlib
+
+from teia_ecosystem_indexer.car_archive import b58encode
+from teia_ecosystem_indexer.car_archive import cid_to_str
+from teia_ecosystem_indexer.car_archive import iter_files
+from teia_ecosystem_indexer.car_archive import uri_multihash
+
+
+def varint(n):
+    out = bytearray()
+    while True:
+        b, n = n & 0x7F, n >> 7
+        out.append(b | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def pb(field, value):
+    if isinstance(value, int):
+        return varint(field << 3) + varint(value)
+    return varint(field << 3 | 2) + varint(len(value)) + value
+
+
+def multihash(data):
+    return b'\x12\x20' + hashlib.sha256(data).digest()
+
+
+def raw_cid(data):
+    return varint(1) + varint(0x55) + multihash(data)
+
+
+def unixfs_file(data, links=()):
+    return b''.join(pb(2, pb(1, link)) for link in links) + pb(1, pb(1, 2) + pb(2, data))
+
+
+def write_car(path, blocks):
+    header = bytes.fromhex('a265726f6f7473806776657273696f6e01')
+    sections = b''.join(varint(len(cid) + len(data)) + cid + data for cid, data in blocks)
+    path.write_bytes(varint(len(header)) + header + sections)
+
+
+def test_uri_multihash_matches_cid_versions():
+    node = unixfs_file(b'{}')
+    v0 = b58encode(multihash(node))
+    v1 = cid_to_str(varint(1) + varint(0x70) + multihash(node))
+    assert v0.startswith('Qm')
+    assert uri_multihash(f'ipfs://{v0}') == uri_multihash(v1) == multihash(node)
+    assert uri_multihash(f'ipfs://{v0}/metadata.json') is None
+
+
+def test_iter_files_reads_raw_dag_pb_and_chunked_files(tmp_path):
+    single = unixfs_file(b'{"name": "one"}')
+    leaf = b'{"name": "two"}'
+    head, tail = b'{"name": ', b'"three"}'
+    chunked = unixfs_file(b'', [raw_cid(head), raw_cid(tail)])
+    # first chunk precedes its root, so it's only picked up by a second pass
+    write_car(
+        tmp_path / 'a.car',
+        [
+            (raw_cid(head), head),
+            (multihash(single), single),
+            (raw_cid(leaf), leaf),
+            (multihash(chunked), chunked),
+            (raw_cid(tail), tail),
+            (raw_cid(b'unrelated'), b'unrelated'),
+        ],
+    )
+    wanted = {multihash(single), multihash(leaf), multihash(chunked), multihash(b'absent')}
+    files = {mh: body for mh, _, body in iter_files([tmp_path / 'a.car'], wanted)}
+    assert files == {
+        multihash(single): b'{"name": "one"}',
+        multihash(leaf): leaf,
+        multihash(chunked): b'{"name": "three"}',
+    }
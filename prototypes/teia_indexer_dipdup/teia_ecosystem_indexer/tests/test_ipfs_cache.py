@@ -0,0 +1,17 @@
+from teia_ecosystem_indexer.ipfs_cache import CidCache
+from teia_ecosystem_indexer.ipfs_cache import normalize_cid
+
+
+def test_normalize_cid_strips_scheme_and_flattens_paths():
+    assert normalize_cid('ipfs://QmAbc') == 'QmAbc'
+    assert normalize_cid('QmAbc/metadata.json') == 'QmAbc%2Fmetadata.json'
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = CidCache(tmp_path)
+    assert cache.get('ipfs://QmXyz123') is None
+    cache.put('QmXyz123', b'{"name": "x"}')
+    assert cache.get('ipfs://QmXyz123') == b'{"name": "x"}'
+    assert (cache.hits, cache.misses) == (1, 1)
+    # sharded on the CID tail, no temp files left behind
+    assert [p.name for p in tmp_path.rglob('*') if p.is_file()] == ['QmXyz123.json.gz']
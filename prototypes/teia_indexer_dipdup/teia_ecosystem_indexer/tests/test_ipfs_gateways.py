@@ -0,0 +1,60 @@
+import asyncio
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from email.utils import format_datetime
+
+import pytest
+
+from teia_ecosystem_indexer.ipfs_gateways import GatewayScheduler
+from teia_ecosystem_indexer.ipfs_gateways import GatewayThrottled
+from teia_ecosystem_indexer.ipfs_gateways import parse_retry_after
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_and_loser_is_cancelled():
+    scheduler = GatewayScheduler(['slow', 'fast'])
+    # equal priors: 'slow' is tried first, 'fast' only as the hedge
+    cancelled = []
+
+    async def fetch_one(gateway):
+        if gateway == 'slow':
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(gateway)
+                raise
+        return {'gateway': gateway}
+
+    for s in scheduler.stats.values():
+        s.samples.extend([0.01] * 5)  # p90 -> MIN_HEDGE_DELAY
+    assert await scheduler.fetch(fetch_one) == {'gateway': 'fast'}
+    assert cancelled == ['slow']
+    assert scheduler.ranked() == ['fast', 'slow']
+
+
+@pytest.mark.asyncio
+async def test_throttled_gateway_cools_down():
+    scheduler = GatewayScheduler(['a', 'b'])
+    calls = []
+
+    async def fetch_one(gateway):
+        calls.append(gateway)
+        if gateway == 'a':
+            raise GatewayThrottled(retry_after=60)
+        return gateway
+
+    assert await scheduler.fetch(fetch_one) == 'b'
+    assert await scheduler.fetch(fetch_one) == 'b'
+    assert calls == ['a', 'b', 'b']
+    assert scheduler.snapshot()['a']['cooling']
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    when = format_datetime(datetime.now(UTC) + timedelta(seconds=90), usegmt=True)
+    assert 80 < parse_retry_after(when) <= 90
+    past = format_datetime(datetime.now(UTC) - timedelta(hours=1), usegmt=True)
+    assert parse_retry_after(past) == 0.0
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from teia_ecosystem_indexer import metadata_parser
+
+
+@pytest.fixture(autouse=True)
+def no_cid_cache(monkeypatch):
+    monkeypatch.setattr(metadata_parser, 'CID_CACHE', None)
+
+
+def test_parse_batch_extracts_fields_and_tags_in_order():
+    token = json.dumps(
+        {
+            'name': 'Gen\u0000 #1',
+            'formats': [{'mimeType': 'image/png'}],
+            'artifactUri': 'ipfs://QmArt',
+            'tags': ['Generative', 'generative ', '', 42],
+        }
+    ).encode()
+    holder = json.dumps({'alias': 'alice', 'avatar': 'ipfs://QmLogo'}).encode()
+
+    results = metadata_parser.parse_batch(
+        [('token', 'QmT', token), ('holder', 'QmH', holder), ('token', 'QmBad', b'<html>')]
+    )
+
+    assert results[0]['fields']['name'] == 'Gen #1'
+    assert results[0]['fields']['mime'] == 'image/png'
+    assert results[0]['tags'] == ['generative']
+    assert results[1]['fields'] == {
+        'content': {'alias': 'alice', 'avatar': 'ipfs://QmLogo'},
+        'bio': None,
+        'alias': 'alice',
+        'logo': 'ipfs://QmLogo',
+    }
+    assert results[2] is None
+
+
+@pytest.mark.asyncio
+async def test_parse_bodies_runs_in_the_pool():
+    bodies = [('token', f'Qm{i}', json.dumps({'name': f'T{i}'}).encode()) for i in range(20)]
+    results = await metadata_parser.parse_bodies(bodies)
+    assert [r['fields']['name'] for r in results] == [f'T{i}' for i in range(20)]
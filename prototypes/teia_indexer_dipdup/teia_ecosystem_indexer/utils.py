@@ -38,6 +38,48 @@ def clean_null_bytes(val: Any) -> Any:
     return val
 
 
+def token_metadata_fields(data: dict[str, Any]) -> dict[str, Any]:
+    """TokenMetadata columns from (null-byte cleaned) token metadata JSON."""
+    mime = ''
+    formats = data.get('formats', [])
+    if formats and isinstance(formats, list) and len(formats) > 0 and 'mimeType' in formats[0]:
+        mime = formats[0]['mimeType']
+    return {
+        'content': data,
+        'name': data.get('name'),
+        'description': data.get('description'),
+        'mime': mime,
+        'artifact_uri': data.get('artifactUri'),
+        'display_uri': data.get('displayUri'),
+        'thumbnail_uri': data.get('thumbnailUri'),
+    }
+
+
+def token_tags(data: dict[str, Any]) -> list[str]:
+    """Distinct lowercased tag names (max 255 chars) from token metadata JSON."""
+    raw_tags = data.get('tags', [])
+    if not isinstance(raw_tags, list):
+        return []
+    tags: dict[str, None] = {}
+    for tag_name in raw_tags:
+        if not isinstance(tag_name, str) or len(tag_name) > 255:
+            continue
+        tag_name = tag_name.lower().strip()
+        if tag_name:
+            tags[tag_name] = None
+    return list(tags)
+
+
+def holder_metadata_fields(data: dict[str, Any]) -> dict[str, Any]:
+    """HolderMetadata columns from (null-byte cleaned) profile metadata JSON."""
+    return {
+        'content': data,
+        'bio': data.get('description'),
+        'alias': data.get('name') or data.get('alias'),
+        'logo': data.get('logo') or data.get('avatar'),
+    }
+
+
 def from_hex(hexbytes: str | None) -> str:
     """Decode hex bytes to UTF-8 or Latin-1 with fallback (hicdex logic)."""
     if not hexbytes: